@@ -1,3 +1,3 @@
-from .simulator import Patient
+from .simulator import Patient, PatientCohort, simulate_population
 from .disturbances import compute_disturbances
 from .metrics import compute_control_metrics
@@ -3,10 +3,74 @@ import numpy as np
 from matplotlib import pyplot as plt
 from matplotlib import cm
 
+# Numba is optional: without it the scalar kernels simply run as plain Python
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
 
 def fsig(x, C50, gam): return x**gam/(C50**gam + x**gam)  # quick definition of sigmoidal function
 
 
+# Scalar kernels used in the simulation hot path.  The compute_* methods stay
+# generic (numpy arrays, casadi symbols) while these only accept floats.
+
+@njit(cache=True)
+def _bis_scalar(cep: float, cer: float, c50p: float, c50r: float,
+                gamma: float, beta: float, e0: float, emax: float) -> float:
+    up = cep / c50p
+    ur = cer / c50r
+    phi = up/(up + ur + 1e-6)
+    u_50 = 1 - beta * (phi - phi*phi)
+    interaction = (up + ur)/u_50
+    ig = interaction ** gamma
+    return e0 - emax * ig / (1 + ig)
+
+
+@njit(cache=True)
+def _tol_scalar(cep: float, cer: float, c50p: float, c50r: float,
+                gamma_p: float, gamma_r: float, pre_intensity: float) -> float:
+    crg = cer ** gamma_r
+    post_opioid = pre_intensity * (1 - crg/(crg + (c50r*pre_intensity) ** gamma_r))
+    cpg = cep ** gamma_p
+    return cpg/(cpg + (c50p*post_opioid) ** gamma_p)
+
+
+@njit(cache=True)
+def _hemo_scalar(cp1: float, cp2: float, cer: float, cn: float,
+                 map_base: float, co_base: float,
+                 emax_nore_map: float, c50_nore_map: float, gamma_nore_map: float,
+                 emax_nore_co: float, c50_nore_co: float, gamma_nore_co: float,
+                 emax_propo_sap: float, emax_propo_dap: float,
+                 c50_propo_map_1: float, gamma_propo_map_1: float,
+                 c50_propo_map_2: float, gamma_propo_map_2: float,
+                 emax_propo_co: float, c50_propo_co: float, gamma_propo_co: float,
+                 emax_remi_map: float, c50_remi_map: float, gamma_remi_map: float,
+                 emax_remi_co: float, c50_remi_co: float, gamma_remi_co: float) -> tuple:
+    cng_map = cn ** gamma_nore_map
+    map_nore = emax_nore_map * cng_map/(c50_nore_map ** gamma_nore_map + cng_map)
+    u_propo = ((cp1/c50_propo_map_1) ** gamma_propo_map_1 +
+               (cp2/c50_propo_map_2) ** gamma_propo_map_2)
+    map_propo = - (emax_propo_dap + (emax_propo_sap + emax_propo_dap) / 3) * u_propo/(1+u_propo)
+    crg_map = cer ** gamma_remi_map
+    map_remi = emax_remi_map * crg_map/(c50_remi_map ** gamma_remi_map + crg_map)
+
+    cng_co = cn ** gamma_nore_co
+    co_nore = emax_nore_co * cng_co/(c50_nore_co ** gamma_nore_co + cng_co)
+    cpm = (cp1 + cp2)/2
+    cpg_co = cpm ** gamma_propo_co
+    co_propo = emax_propo_co * cpg_co/(c50_propo_co ** gamma_propo_co + cpg_co)
+    crg_co = cer ** gamma_remi_co
+    co_remi = emax_remi_co * crg_co/(c50_remi_co ** gamma_remi_co + crg_co)
+
+    return (map_base + map_nore + map_propo + map_remi,
+            co_base + co_nore + co_propo + co_remi)
+
+
 class BIS_model:
     r"""Surface Response model to link Propofol and Remifentanil blood concentration to BIS.
 
@@ -147,6 +211,11 @@ class BIS_model:
 
         return bis
 
+    def compute_bis_fast(self, c_es_propo: float, c_es_remi: float) -> float:
+        """Scalar fast path of compute_bis, used in the simulation loop."""
+        return _bis_scalar(c_es_propo, c_es_remi, self.c50p, self.c50r,
+                           self.gamma, self.beta, self.E0, self.Emax)
+
     def update_param_blood_loss(self, v_ratio: float):
         """Update PK coefficient to mimic a blood loss.
 
@@ -322,6 +391,11 @@ class TOL_model():
         tol = fsig(c_es_propo, self.c50p*post_opioid, self.gamma_p)
         return tol
 
+    def compute_tol_fast(self, c_es_propo: float, c_es_remi: float) -> float:
+        """Scalar fast path of compute_tol, used in the simulation loop."""
+        return _tol_scalar(c_es_propo, c_es_remi, self.c50p, self.c50r,
+                           self.gamma_p, self.gamma_r, self.pre_intensity)
+
     def plot_surface(self):
         """Plot the 3D-Hill surface of the BIS related to Propofol and Remifentanil effect site concentration."""
         cer = np.linspace(0, 20, 50)
@@ -650,18 +724,77 @@ class Hemo_PD_model():
             Cardiac output (L/min), without blood loss.
 
         """
-        map_nore = self.emax_nore_map * fsig(c_es_nore, self.c50_nore_map, self.gamma_nore_map)
+        map_base_effect, co_base_effect = self.compute_hemo_base(c_es_propo, c_es_remi)
+        map_nore, co_nore = self.compute_hemo_nore(c_es_nore)
+
+        self.map = map_base_effect + map_nore
+        self.co = co_base_effect + co_nore
+
+        return self.map, self.co
+
+    def compute_hemo_base(self, c_es_propo: list, c_es_remi: float) -> tuple:
+        """Compute MAP and CO under Propofol and Remifentanil only.
+
+        Since the drug effects add up in the model, the Norepinephrine
+        contribution from compute_hemo_nore can be added afterwards.
+
+        Parameters
+        ----------
+        c_es_propo : list
+            Propofolconcentration on both hemodynamic effect site concentration µg/mL.
+        c_es_remi : float
+            Remifentanil hemodynamic effect site concentration µg/mL.
+
+        Returns
+        -------
+        map : float
+            Mean arterial pressure (mmHg), without Norepinephrine nor blood loss.
+        co : float
+            Cardiac output (L/min), without Norepinephrine nor blood loss.
+
+        """
         u_propo = ((c_es_propo[0]/self.c50_propo_map_1)**self.gamma_propo_map_1 +
                    (c_es_propo[1]/self.c50_propo_map_2)**self.gamma_propo_map_2)
         map_propo = - (self.emax_propo_DAP + (self.emax_propo_SAP + self.emax_propo_DAP) / 3) * u_propo/(1+u_propo)
         map_remi = self.emax_remi_map * fsig(c_es_remi, self.c50_remi_map, self.gamma_remi_map)
 
-        self.map = self.map_base + map_nore + map_propo + map_remi
-
-        co_nore = self.emax_nore_co * fsig(c_es_nore, self.c50_nore_co, self.gamma_nore_co)
         co_propo = self.emax_propo_co * fsig((c_es_propo[0] + c_es_propo[1])/2, self.c50_propo_co, self.gamma_propo_co)
         co_remi = self.emax_remi_co * fsig(c_es_remi, self.c50_remi_co, self.gamma_remi_co)
 
-        self.co = self.co_base + co_nore + co_propo + co_remi
+        return self.map_base + map_propo + map_remi, self.co_base + co_propo + co_remi
+
+    def compute_hemo_nore(self, c_es_nore: float) -> tuple:
+        """Compute the additive Norepinephrine contribution to MAP and CO.
 
+        Parameters
+        ----------
+        c_es_nore : float
+            Norepinephrine hemodynamic effect site concentration µg/mL.
+
+        Returns
+        -------
+        map_nore : float
+            Norepinephrine effect on Mean arterial pressure (mmHg).
+        co_nore : float
+            Norepinephrine effect on Cardiac output (L/min).
+
+        """
+        map_nore = self.emax_nore_map * fsig(c_es_nore, self.c50_nore_map, self.gamma_nore_map)
+        co_nore = self.emax_nore_co * fsig(c_es_nore, self.c50_nore_co, self.gamma_nore_co)
+        return map_nore, co_nore
+
+    def compute_hemo_fast(self, c_es_propo_1: float, c_es_propo_2: float,
+                          c_es_remi: float, c_es_nore: float) -> tuple:
+        """Scalar fast path of compute_hemo, used in the simulation loop."""
+        self.map, self.co = _hemo_scalar(
+            c_es_propo_1, c_es_propo_2, c_es_remi, c_es_nore,
+            self.map_base, self.co_base,
+            self.emax_nore_map, self.c50_nore_map, self.gamma_nore_map,
+            self.emax_nore_co, self.c50_nore_co, self.gamma_nore_co,
+            self.emax_propo_SAP, self.emax_propo_DAP,
+            self.c50_propo_map_1, self.gamma_propo_map_1,
+            self.c50_propo_map_2, self.gamma_propo_map_2,
+            self.emax_propo_co, self.c50_propo_co, self.gamma_propo_co,
+            self.emax_remi_map, self.c50_remi_map, self.gamma_remi_map,
+            self.emax_remi_co, self.c50_remi_co, self.gamma_remi_co)
         return self.map, self.co
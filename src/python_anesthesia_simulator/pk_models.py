@@ -1,9 +1,532 @@
 # Standard import
-import copy
+from functools import lru_cache
+from math import exp, log, sqrt
 
 # Third party imports
 import numpy as np
-import control
+from scipy.linalg import expm
+
+# Numba is optional: without it the stepping kernel simply runs as plain Python
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
+
+@njit(cache=True)
+def _step(Ad: np.ndarray, Bd: np.ndarray, x: np.ndarray, u: float, out: np.ndarray) -> np.ndarray:
+    """Compute the discrete state update :math:`x^+ = A_d x + B_d u` into out.
+
+    The state has at most six components, so an explicit double loop compiles
+    to straight-line code under numba and skips the BLAS dispatch of np.dot.
+    """
+    n = Ad.shape[0]
+    for i in range(n):
+        acc = Bd[i] * u
+        for j in range(n):
+            acc += Ad[i, j] * x[j]
+        out[i] = acc
+    return out
+
+
+@njit(cache=True)
+def _step_block(Ad: np.ndarray, Bd: np.ndarray, x: np.ndarray, u: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Discrete state update with several inputs, :math:`x^+ = A_d x + B_d u` into out.
+
+    Used to step a block-diagonal stack of PK models in a single call, with Bd
+    of shape (nx, nu) and u of shape (nu,).
+    """
+    n = Ad.shape[0]
+    m = Bd.shape[1]
+    for i in range(n):
+        acc = 0.
+        for k in range(m):
+            acc += Bd[i, k] * u[k]
+        for j in range(n):
+            acc += Ad[i, j] * x[j]
+        out[i] = acc
+    return out
+
+
+# Order-7 Padé coefficients of the matrix exponential
+_PADE7_B = (17297280., 8648640., 1995840., 277200., 25200., 1512., 56., 1.)
+
+
+def _expm_pk(M: np.ndarray) -> np.ndarray:
+    """Matrix exponential by scaling and squaring with an order-7 Padé approximant.
+
+    The augmented matrices discretized here are tiny (at most 7x7) and well
+    scaled, so a fixed order-7 approximant reaches machine precision while
+    avoiding the input validation and order selection overhead of
+    scipy.linalg.expm.
+    """
+    norm = np.linalg.norm(M, np.inf)
+    s = 0
+    if norm > 0.5:
+        s = int(np.ceil(np.log2(norm / 0.5)))
+        M = M / 2.0 ** s
+    b = _PADE7_B
+    ident = np.eye(M.shape[0])
+    M2 = M @ M
+    M4 = M2 @ M2
+    M6 = M4 @ M2
+    U = M @ (b[7] * M6 + b[5] * M4 + b[3] * M2 + b[1] * ident)
+    V = b[6] * M6 + b[4] * M4 + b[2] * M2 + b[0] * ident
+    F = np.linalg.solve(V - U, V + U)
+    for _ in range(s):
+        F = F @ F
+    return F
+
+
+def _fsig(x: float, C50: float, gam: float) -> float:
+    """Hill (sigmoid) function used in the Eleveld models."""
+    xg = x**gam
+    return xg/(C50**gam + xg)
+
+
+def _fsig1(x: float, C50: float) -> float:
+    """Hill function with a unit slope coefficient, no pow needed."""
+    return x/(C50 + x)
+
+
+def _fal_sallami(sexX: bool, weightX: float, ageX: float, bmiX: float) -> float:
+    """Fat free mass estimated with the Al-Sallami equation."""
+    if sexX:
+        return (0.88 + (1-0.88)/(1+(ageX/13.4)**(-12.7)))*(9270*weightX)/(6680+216*bmiX)
+    else:
+        return (1.11 + (1 - 1.11)/(1+(ageX/7.1)**(-1.1)))*(9270*weightX)/(8780+244*bmiX)
+
+
+# Model coefficient tables, hoisted to module level so they are built once
+# instead of at every parameter derivation.  The leading None keeps the same
+# indexing as in the papers.
+_SCHUTTLER_THETA = (None,
+                    1.44,   # Cl1 [l/min]
+                    9.3,    # v1ref [l]
+                    2.25,   # Cl2 [l/min]
+                    44.2,   # v2ref [l]
+                    0.92,   # Cl3 [l/min]
+                    266,    # v3ref [l]
+                    0.75,
+                    0.62,
+                    0.61,
+                    0.045,
+                    0.55,
+                    0.71,
+                    -0.39,
+                    -0.40,
+                    1.61,
+                    2.02,
+                    0.73,
+                    -0.48)
+
+_ELEVELD_PROPO_THETA = (None,
+                        6.2830780766822,     # V1ref [l]
+                        25.5013145036879,    # V2ref [l]
+                        272.8166615043603,   # V3ref [l]
+                        1.7895836588902,     # Clref [l/min]
+                        1.7500983738779,     # Q2ref [l/min]
+                        1.1085424008536,     # Q3ref [l/min]
+                        0.191307,            # Typical residual error
+                        42.2760190602615,    # CL maturation E50
+                        9.0548452392807,     # CL maturation slope [weeks]
+                        -0.015633,           # Smaller V2 with age
+                        -0.00285709,         # Lower CL with age
+                        33.5531248778544,    # Weight for 50 % of maximal V1 [kg]
+                        -0.0138166,          # Smaller V3 with age
+                        68.2767978846832,    # Maturation of Q3 [weeks]
+                        2.1002218877899,     # CLref (female) [l/min]
+                        1.3042680471360,     # Higher Q2 for maturation of Q3
+                        1.4189043652084,     # V1 venous samples (children)
+                        0.6805003109141)     # Higer Q2 venous samples
+
+_ELEVELD_REMI_THETA = (None,
+                       2.88,
+                       -0.00554,
+                       -0.00327,
+                       -0.0315,
+                       0.470,
+                       -0.0260)
+
+
+@lru_cache(maxsize=4096)
+def _pk_params(drug: str, model: str, age: float, height: float, weight: float,
+               gender: bool, lbm: float, opiate: bool, measurement: str) -> dict:
+    """Derive the nominal PK parameters of a drug model for a given patient.
+
+    The result only depends on the patient characteristics and on the chosen
+    model, so it is memoized with an lru_cache: cohorts with repeated patient
+    archetypes skip the whole derivation. The returned dictionary contains the
+    volumes, clearances and transfer rates of the model together with the
+    log-normal standard deviation of each parameter (keys prefixed by "w_").
+    It is shared between calls and must not be mutated by the caller.
+    """
+    if drug == "Propofol":
+        if model == 'Schnider':
+            # see T. W. Schnider et al., “The Influence of Age on Propofol Pharmacodynamics,”
+            # Anesthesiology, vol. 90, no. 6, pp. 1502-1516., Jun. 1999, doi: 10.1097/00000542-199906000-00003.
+
+            # Clearance Rates [l/min]
+            cl1 = 1.89 + 0.0456 * (weight - 77) - 0.0681 * \
+                (lbm - 59) + 0.0264 * (height - 177)
+            cl2 = 1.29 - 0.024 * (age - 53)
+            cl3 = 0.836
+            # Volume of the compartmente [l]
+            v1 = 4.27
+            v2 = 18.9 - 0.391 * (age - 53)
+            v3 = 238
+            # drug amount transfer rates [1/min]
+            ke0 = 0.456
+
+            # variability
+            cv_v1 = v1*0.0404
+            cv_v2 = v2*0.01
+            cv_v3 = v3*0.1435
+            cv_cl1 = cl1*0.1005
+            cv_cl2 = cl2*0.01
+            cv_cl3 = cl3*0.1179
+            cv_ke = ke0*0.42  # The real value seems to be not available in the article
+
+            # estimation of log normal standard deviation
+            w_v1 = sqrt(log(1+cv_v1**2))
+            w_v2 = sqrt(log(1+cv_v2**2))
+            w_v3 = sqrt(log(1+cv_v3**2))
+            w_cl1 = sqrt(log(1+cv_cl1**2))
+            w_cl2 = sqrt(log(1+cv_cl2**2))
+            w_cl3 = sqrt(log(1+cv_cl3**2))
+            w_ke0 = sqrt(log(1+cv_ke**2))
+
+        elif model == 'Marsh_initial' or model == 'Marsh_modified':
+            # see B. Marsh, M. White, N. morton, and G. N. C. Kenny,
+            # “Pharmacokinetic model Driven Infusion of Propofol in Children,”
+            # BJA: British Journal of Anaesthesia, vol. 67, no. 1, pp. 41–48, Jul. 1991, doi: 10.1093/bja/67.1.41.
+
+            v1 = 0.228 * weight
+            v2 = 0.463 * weight
+            v3 = 2.893 * weight
+            cl1 = 0.119 * v1
+            cl2 = 0.112 * v1
+            cl3 = 0.042 * v1
+
+            if model == 'Marsh_initial':
+                ke0 = 0.26
+            else:
+                ke0 = 1.2
+
+            # variability
+            # estimation of log normal standard deviation
+            # not given in the paper so estimated at 100% for each variable
+            w_v1 = sqrt(log(1+1**2))
+            w_v2 = sqrt(log(1+1**2))
+            w_v3 = sqrt(log(1+1**2))
+            w_cl1 = sqrt(log(1+1**2))
+            w_cl2 = sqrt(log(1+1**2))
+            w_cl3 = sqrt(log(1+1**2))
+            w_ke0 = sqrt(log(1+1**2))
+
+        elif model == 'Schuttler':
+            # J. Schüttler and H. Ihmsen, “Population Pharmacokinetics of Propofol: A Multicenter Study,”
+            # Anesthesiology, vol. 92, no. 3, pp. 727–738, Mar. 2000, doi: 10.1097/00000542-200003000-00017.
+
+            theta = _SCHUTTLER_THETA
+
+            # the weight ratio is raised to six different powers: take its log
+            # once and use exp(theta * log) instead of six float pows
+            lw = log(weight/70)
+            v1 = theta[2] * exp(theta[12]*lw) * (age/30)**theta[13]
+            v2 = theta[4] * exp(theta[9]*lw)
+            v3 = theta[6]
+            if age <= 60:
+                cl1 = theta[1] * exp(theta[7]*lw)
+            else:
+                cl1 = theta[1] * exp(theta[7]*lw) - (age-60)*theta[10]
+            cl2 = theta[3] * exp(theta[8]*lw)
+            cl3 = theta[5] * exp(theta[11]*lw)
+
+            # no PD model so we reuse Marsh modified one
+            ke0 = 1.2
+
+            # variability
+            cv_v1 = 0.400
+            cv_v2 = 0.548
+            cv_v3 = 0.469
+            cv_cl1 = 0.374
+            cv_cl2 = 0.519
+            cv_cl3 = 0.509
+            # estimation of log normal standard deviation
+            w_v1 = sqrt(log(1+cv_v1**2))
+            w_v2 = sqrt(log(1+cv_v2**2))
+            w_v3 = sqrt(log(1+cv_v3**2))
+            w_cl1 = sqrt(log(1+cv_cl1**2))
+            w_cl2 = sqrt(log(1+cv_cl2**2))
+            w_cl3 = sqrt(log(1+cv_cl3**2))
+            w_ke0 = sqrt(log(1+1**2))
+
+        elif model == 'Eleveld':
+            # see D. J. Eleveld, P. Colin, A. R. Absalom, and M. M. R. F. Struys,
+            # “Pharmacokinetic–pharmacodynamic model for propofol for broad application in anaesthesia and sedation”
+            # British Journal of Anaesthesia, vol. 120, no. 5, pp. 942–959, mai 2018, doi:10.1016/j.bja.2018.01.018.
+
+            # reference patient
+            AGE_ref = 35
+            WGT_ref = 70
+            HGT_ref = 1.7
+            PMA_ref = (40+AGE_ref*52)/52  # not born prematurely and now 35 yo
+            BMI_ref = WGT_ref/HGT_ref**2
+            GDR_ref = 1  # 1 male, 0 female
+
+            theta = _ELEVELD_PROPO_THETA
+
+            PMA = age + 40/52
+            BMI = weight/(height/100)**2
+
+            fCLmat = _fsig(PMA * 52, theta[8], theta[9])
+            fCLmat_ref = _fsig(PMA_ref*52, theta[8], theta[9])
+            fQ3mat = _fsig1(PMA * 52, theta[14])
+            fQ3mat_ref = _fsig1(PMA_ref * 52, theta[14])
+            fsal = _fal_sallami(gender, weight, age, BMI)
+            fsal_ref = _fal_sallami(GDR_ref, WGT_ref, AGE_ref, BMI_ref)
+            fcentral = _fsig1(weight, theta[12])
+            fcentral_ref = _fsig1(WGT_ref, theta[12])
+
+            if opiate:
+                fopiate_v3 = exp(theta[13]*age)
+                fopiate_cl1 = exp(theta[11]*age)
+            else:
+                fopiate_v3 = 1
+                fopiate_cl1 = 1
+
+            # reference: male, 70kg, 35 years and 170cm
+
+            v1 = theta[1] * fcentral/fcentral_ref
+            if measurement == "venous":
+                v1 = v1 * (1 + theta[17] * (1 - fcentral))
+            v2 = theta[2] * weight/WGT_ref * exp(theta[10] * (age - AGE_ref))
+            v2ref = theta[2]
+            v3 = theta[3] * fsal/fsal_ref * fopiate_v3
+            v3ref = theta[3]
+            cl1 = (gender*theta[4] + (1-gender)*theta[15]) * (weight/WGT_ref)**0.75 * \
+                fCLmat/fCLmat_ref * fopiate_cl1
+
+            cl2 = theta[5]*(v2/v2ref)**0.75 * (1 + theta[16] * (1 - fQ3mat))
+            if measurement == "venous":
+                cl2 = cl2*theta[18]
+
+            cl3 = theta[6] * (v3/v3ref)**0.75 * fQ3mat/fQ3mat_ref
+
+            ke0 = 0.146*(weight/70)**(-0.25)
+
+            # Coeff variability
+            cv_v1 = v1*0.917
+            cv_v2 = v2*0.871
+            cv_v3 = v3*0.904
+            cv_cl1 = cl1*0.551
+            cv_cl2 = cl2*0.643
+            cv_cl3 = cl3*0.482
+
+            # log normal standard deviation
+            w_v1 = sqrt(0.610)
+            w_v2 = sqrt(0.565)
+            w_v3 = sqrt(0.597)
+            w_cl1 = sqrt(0.265)
+            w_cl2 = sqrt(0.346)
+            w_cl3 = sqrt(0.209)
+            w_ke0 = sqrt(0.702)
+
+        # see C. Jeleazcov, M. Lavielle, J. Schüttler, and H. Ihmsen,
+        # “Pharmacodynamic response modelling of arterial blood pressure in adult
+        # volunteers during propofol anaesthesia,”
+        # BJA: British Journal of Anaesthesia, vol. 115, no. 2, pp. 213–226, Aug. 2015, doi: 10.1093/bja/aeu553.
+        ke1_map = 0.054
+        ke2_map = 0.0695
+        w_ke1_map = 1.5
+        w_ke2_map = 1.48
+
+    elif drug == "Remifentanil":
+        if model == 'Minto':
+            #  see C. F. Minto et al., “Influence of Age and Gender on the Pharmacokinetics
+            # and Pharmacodynamics of Remifentanil: I. Model Development,”
+            # Anesthesiology, vol. 86, no. 1, pp. 10–23, Jan. 1997, doi: 10.1097/00000542-199701000-00004.
+
+            # Clearance Rates [l/min]
+            cl1 = 2.6 - 0.0162 * (age - 40) + 0.0191 * (lbm - 55)
+            cl2 = 2.05 - 0.0301 * (age - 40)
+            cl3 = 0.076 - 0.00113 * (age - 40)
+
+            # Volume of the compartmente [l]
+            v1 = 5.1 - 0.0201 * (age-40) + 0.072 * (lbm - 55)
+            v2 = 9.82 - 0.0811 * (age-40) + 0.108 * (lbm-55)
+            v3 = 5.42
+
+            ke0 = 0.595 - 0.007 * (age - 40)  # [1/min]
+
+            # variability
+            cv_v1 = 0.26
+            cv_v2 = 0.29
+            cv_v3 = 0.66
+            cv_cl1 = 0.14
+            cv_cl2 = 0.36
+            cv_cl3 = 0.41
+            cv_ke = 0.68
+
+            # estimation of log normal standard deviation
+            w_v1 = sqrt(log(1+cv_v1**2))
+            w_v2 = sqrt(log(1+cv_v2**2))
+            w_v3 = sqrt(log(1+cv_v3**2))
+            w_cl1 = sqrt(log(1+cv_cl1**2))
+            w_cl2 = sqrt(log(1+cv_cl2**2))
+            w_cl3 = sqrt(log(1+cv_cl3**2))
+            w_ke0 = sqrt(log(1+cv_ke**2))
+
+        elif model == 'Eleveld':
+            # see D. J. Eleveld et al., “An Allometric Model of Remifentanil Pharmacokinetics and Pharmacodynamics,”
+            # Anesthesiology, vol. 126, no. 6, pp. 1005–1018, juin 2017, doi: 10.1097/ALN.0000000000001634.
+
+            # reference patient
+            AGE_ref = 35
+            WGT_ref = 70
+            HGT_ref = 1.7
+            PMA_ref = (40+AGE_ref*52)/52  # not born prematurely and now 35 yo
+            BMI_ref = WGT_ref/HGT_ref**2
+            GDR_ref = 1  # 1 male, 0 female
+
+            BMI = weight/(height/100)**2
+
+            SIZE = (_fal_sallami(gender, weight, age, BMI)/_fal_sallami(GDR_ref, WGT_ref, AGE_ref, BMI_ref))
+
+            theta = _ELEVELD_REMI_THETA
+
+            KMAT = _fsig(weight, theta[1], 2)
+            KMATref = _fsig(WGT_ref, theta[1], 2)
+            if gender:
+                KSEX = 1
+            else:
+                KSEX = 1+theta[5]*_fsig(age, 12, 6)*(1-_fsig(age, 45, 6))
+
+            faging_2 = exp(theta[2] * (age - AGE_ref))
+            faging_3 = exp(theta[3] * (age - AGE_ref))
+            faging_4 = exp(theta[4] * (age - AGE_ref))
+
+            v1ref = 5.81
+            v1 = v1ref * SIZE * faging_2
+            V2ref = 8.882
+            v2 = V2ref * SIZE * faging_3
+            V3ref = 5.03
+            v3 = V3ref * SIZE * faging_4*exp(theta[6]*(weight - WGT_ref))
+            cl1ref = 2.58
+            cl2ref = 1.72
+            cl3ref = 0.124
+            cl1 = cl1ref * SIZE**0.75 * (KMAT/KMATref)*KSEX*faging_3
+            cl2 = cl2ref * (v2/V2ref)**0.75 * faging_2 * KSEX
+            cl3 = cl3ref * (v3/V3ref)**0.75 * faging_2
+
+            ke0 = 1.09 * exp(-0.0289 * (age - AGE_ref))
+
+            # log normal standard deviation
+            w_v1 = sqrt(0.104)
+            w_v2 = sqrt(0.115)
+            w_v3 = sqrt(0.810)
+            w_cl1 = sqrt(0.0197)
+            w_cl2 = sqrt(0.0547)
+            w_cl3 = sqrt(0.285)
+            w_ke0 = sqrt(1.26)
+        # see J. F. Standing, G. B. Hammer, W. J. Sam, and D. R. Drover,
+        # “Pharmacokinetic–pharmacodynamic modeling of the hypotensive effect of
+        # remifentanil in infants undergoing cranioplasty,”
+        # Pediatric Anesthesia, vol. 20, no. 1, pp. 7–18, 2010, doi: 10.1111/j.1460-9592.2009.03174.x.
+        ke_map = 0.81
+        w_ke_map = 0.41
+    elif drug == 'Norepinephrine':
+        # see H. Beloeil, J.-X. Mazoit, D. Benhamou, and J. Duranteau, “Norepinephrine kinetics and dynamics
+        # in septic shock and trauma patients,” BJA: British Journal of Anaesthesia,
+        # vol. 95, no. 6, pp. 782–788, Dec. 2005, doi: 10.1093/bja/aei259.
+
+        v1 = 8.840
+        cl1 = 2  # suppose SAPS II = 30 ()
+
+        w_v1 = 1.63
+        w_cl1 = 0.974
+
+    if drug == "Propofol":
+        return {'v1': v1, 'v2': v2, 'v3': v3, 'cl1': cl1, 'cl2': cl2, 'cl3': cl3,
+                'ke0': ke0, 'ke1_map': ke1_map, 'ke2_map': ke2_map,
+                'w_v1': w_v1, 'w_v2': w_v2, 'w_v3': w_v3,
+                'w_cl1': w_cl1, 'w_cl2': w_cl2, 'w_cl3': w_cl3,
+                'w_ke0': w_ke0, 'w_ke1_map': w_ke1_map, 'w_ke2_map': w_ke2_map}
+    elif drug == "Remifentanil":
+        return {'v1': v1, 'v2': v2, 'v3': v3, 'cl1': cl1, 'cl2': cl2, 'cl3': cl3,
+                'ke0': ke0, 'ke_map': ke_map,
+                'w_v1': w_v1, 'w_v2': w_v2, 'w_v3': w_v3,
+                'w_cl1': w_cl1, 'w_cl2': w_cl2, 'w_cl3': w_cl3,
+                'w_ke0': w_ke0, 'w_ke_map': w_ke_map}
+    elif drug == "Norepinephrine":
+        return {'v1': v1, 'cl1': cl1, 'w_v1': w_v1, 'w_cl1': w_cl1}
+
+
+# Output matrices, shared by every model of the same drug: the output is the
+# effect-site concentration (4th state) for propofol and remifentanil and the
+# blood concentration for norepinephrine.  They must not be mutated.
+_C_PROPO = np.array([[0, 0, 0, 1, 0, 0]])
+_C_REMI = np.array([[0, 0, 0, 1, 0]])
+_C_NORE = np.array([[1]])
+_D = np.array([[0]])
+
+
+def _pk_matrices(drug: str, params: dict) -> tuple:
+    """Build the nominal continuous matrices (A, B, C, D) from the PK parameters of a drug."""
+    v1 = params['v1']
+    if drug == "Propofol":
+        # drug amount transfer rates [1/min]
+        k10 = params['cl1'] / v1
+        k12 = params['cl2'] / v1
+        k13 = params['cl3'] / v1
+        k21 = params['cl2'] / params['v2']
+        k31 = params['cl3'] / params['v3']
+        ke0 = params['ke0']
+        ke1_map = params['ke1_map']
+        ke2_map = params['ke2_map']
+
+        A = np.array([[-(k10 + k12 + k13), k21, k31, 0, 0, 0],
+                      [k12, -k21, 0, 0, 0, 0],
+                      [k13, 0, -k31, 0, 0, 0],
+                      [ke0, 0, 0, -ke0, 0, 0],
+                      [ke1_map, 0, 0, 0, -ke1_map, 0],
+                      [ke2_map, 0, 0, 0, 0, -ke2_map]])/60  # 1/s
+
+        B = np.array([[1/v1], [0], [0], [0], [0], [0]])  # 1/L
+        C = _C_PROPO
+        D = _D
+    elif drug == "Remifentanil":
+        # drug amount transfer rates [1/min]
+        k10 = params['cl1'] / v1
+        k12 = params['cl2'] / v1
+        k13 = params['cl3'] / v1
+        k21 = params['cl2'] / params['v2']
+        k31 = params['cl3'] / params['v3']
+        ke0 = params['ke0']
+        ke_map = params['ke_map']
+
+        A = np.array([[-(k10 + k12 + k13), k21, k31, 0, 0],
+                      [k12, -k21, 0, 0, 0],
+                      [k13, 0, -k31, 0, 0],
+                      [ke0, 0, 0, -ke0, 0],
+                      [ke_map, 0, 0, 0, -ke_map]])/60  # 1/s
+
+        B = np.array([[1/v1], [0], [0], [0], [0]])  # 1/L
+        C = _C_REMI
+        D = _D
+    elif drug == "Norepinephrine":
+        # drug amount transfer rates [1/min]
+        k10 = params['cl1'] / v1
+
+        A = np.array([[-k10]])/60  # 1/s
+        B = np.array([[1/v1]])  # 1/L
+        C = _C_NORE
+        D = _D
+    return A, B, C, D
 
 
 class CompartmentModel:
@@ -39,6 +562,10 @@ class CompartmentModel:
     measurement : str, optional
         For Elelevd model for propofol, specify the measuremnt place for blood concentration.
         Can be either 'arterial' or 'venous'. The default is 'arterial'.
+    seed : int or numpy.random.Generator, optional
+        Seed of the random generator used to sample the model uncertainties;
+        an existing Generator can be given to share it between models.
+        The default is None.
 
     Attributes
     ----------
@@ -52,10 +579,14 @@ class CompartmentModel:
         Initial value of the matrix B.
     v1 : float
         Volume of the first compartement.
+    Ad : numpy array
+        Dynamic matrix of the discrete system.
+    Bd : numpy array
+        Input matrix of the discrete system.
     continuous_sys : control.StateSpace
-        Continuous state space model.
+        Continuous state space model, built at the first access.
     discrete_sys : control.StateSpace
-        Discrete state space model.
+        Discrete state space model, built at the first access.
     x : list
         State vector.
     y : list
@@ -87,483 +618,224 @@ class CompartmentModel:
 
     """
 
+    # fixed attribute layout: skips the per-instance dict and makes attribute
+    # access slightly faster in the stepping hot path
+    __slots__ = ('ts', '_rng', 'drug', 'v1', 'A', 'B', 'C', 'D',
+                 'A_init', 'B_init', 'Ad', 'Bd', '_co_cache', '_bl_cache',
+                 '_continuous_sys', '_discretize_sys',
+                 'x', 'y', '_x_tmp', '_y_buf', '_iy', '_dcgain', '_x_eq_unit',
+                 '_version')
+
     def __init__(self, Patient_characteristic: list, lbm: float,
                  drug: str, model: str = None, ts: float = 1,
                  random: bool = False, x0: list = None,
-                 opiate=True, measurement="arterial"):
+                 opiate=True, measurement="arterial", seed=None):
         """Init the class."""
         self.ts = ts
+        self._rng = np.random.default_rng(seed)
         age = Patient_characteristic[0]
         height = Patient_characteristic[1]
         weight = Patient_characteristic[2]
         gender = Patient_characteristic[3]
-        if drug == "Propofol":
-            if model is None:
+        if model is None:
+            if drug == "Propofol":
                 model = 'Schnider'
-            if model == 'Schnider':
-                # see T. W. Schnider et al., “The Influence of Age on Propofol Pharmacodynamics,”
-                # Anesthesiology, vol. 90, no. 6, pp. 1502-1516., Jun. 1999, doi: 10.1097/00000542-199906000-00003.
-
-                # Clearance Rates [l/min]
-                cl1 = 1.89 + 0.0456 * (weight - 77) - 0.0681 * \
-                    (lbm - 59) + 0.0264 * (height - 177)
-                cl2 = 1.29 - 0.024 * (age - 53)
-                cl3 = 0.836
-                # Volume of the compartmente [l]
-                v1 = 4.27
-                v2 = 18.9 - 0.391 * (age - 53)
-                v3 = 238
-                # drug amount transfer rates [1/min]
-                ke0 = 0.456
-
-                # variability
-                cv_v1 = v1*0.0404
-                cv_v2 = v2*0.01
-                cv_v3 = v3*0.1435
-                cv_cl1 = cl1*0.1005
-                cv_cl2 = cl2*0.01
-                cv_cl3 = cl3*0.1179
-                cv_ke = ke0*0.42  # The real value seems to be not available in the article
-
-                # estimation of log normal standard deviation
-                w_v1 = np.sqrt(np.log(1+cv_v1**2))
-                w_v2 = np.sqrt(np.log(1+cv_v2**2))
-                w_v3 = np.sqrt(np.log(1+cv_v3**2))
-                w_cl1 = np.sqrt(np.log(1+cv_cl1**2))
-                w_cl2 = np.sqrt(np.log(1+cv_cl2**2))
-                w_cl3 = np.sqrt(np.log(1+cv_cl3**2))
-                w_ke0 = np.sqrt(np.log(1+cv_ke**2))
-
-            elif model == 'Marsh_initial' or model == 'Marsh_modified':
-                # see B. Marsh, M. White, N. morton, and G. N. C. Kenny,
-                # “Pharmacokinetic model Driven Infusion of Propofol in Children,”
-                # BJA: British Journal of Anaesthesia, vol. 67, no. 1, pp. 41–48, Jul. 1991, doi: 10.1093/bja/67.1.41.
-
-                v1 = 0.228 * weight
-                v2 = 0.463 * weight
-                v3 = 2.893 * weight
-                cl1 = 0.119 * v1
-                cl2 = 0.112 * v1
-                cl3 = 0.042 * v1
-
-                if model == 'Marsh_initial':
-                    ke0 = 0.26
-                else:
-                    ke0 = 1.2
-
-                # variability
-                # estimation of log normal standard deviation
-                # not given in the paper so estimated at 100% for each variable
-                w_v1 = np.sqrt(np.log(1+1**2))
-                w_v2 = np.sqrt(np.log(1+1**2))
-                w_v3 = np.sqrt(np.log(1+1**2))
-                w_cl1 = np.sqrt(np.log(1+1**2))
-                w_cl2 = np.sqrt(np.log(1+1**2))
-                w_cl3 = np.sqrt(np.log(1+1**2))
-                w_ke0 = np.sqrt(np.log(1+1**2))
-
-            elif model == 'Schuttler':
-                # J. Schüttler and H. Ihmsen, “Population Pharmacokinetics of Propofol: A Multicenter Study,”
-                # Anesthesiology, vol. 92, no. 3, pp. 727–738, Mar. 2000, doi: 10.1097/00000542-200003000-00017.
-
-                theta = [None,  # just to get same index than in the paper
-                         1.44,  # Cl1 [l/min]
-                         9.3,  # v1ref [l]
-                         2.25,  # Cl2 [l/min]
-                         44.2,  # v2ref [l]
-                         0.92,  # Cl3 [l/min]
-                         266,  # v3ref [l]
-                         0.75,
-                         0.62,
-                         0.61,
-                         0.045,
-                         0.55,
-                         0.71,
-                         -0.39,
-                         -0.40,
-                         1.61,
-                         2.02,
-                         0.73,
-                         -0.48]
-
-                v1 = theta[2] * (weight/70)**theta[12] * (age/30)**theta[13]
-                v2 = theta[4] * (weight/70)**theta[9]
-                v3 = theta[6]
-                if age <= 60:
-                    cl1 = theta[1] * (weight/70)**theta[7]
-                else:
-                    cl1 = theta[1] * (weight/70)**theta[7] - (age-60)*theta[10]
-                cl2 = theta[3] * (weight/70)**theta[8]
-                cl3 = theta[5] * (weight/70)**theta[11]
-
-                # no PD model so we reuse Marsh modified one
-                ke0 = 1.2
-
-                # variability
-                cv_v1 = 0.400
-                cv_v2 = 0.548
-                cv_v3 = 0.469
-                cv_cl1 = 0.374
-                cv_cl2 = 0.519
-                cv_cl3 = 0.509
-                # estimation of log normal standard deviation
-                w_v1 = np.sqrt(np.log(1+cv_v1**2))
-                w_v2 = np.sqrt(np.log(1+cv_v2**2))
-                w_v3 = np.sqrt(np.log(1+cv_v3**2))
-                w_cl1 = np.sqrt(np.log(1+cv_cl1**2))
-                w_cl2 = np.sqrt(np.log(1+cv_cl2**2))
-                w_cl3 = np.sqrt(np.log(1+cv_cl3**2))
-                w_ke0 = np.sqrt(np.log(1+1**2))
-
-            elif model == 'Eleveld':
-                # see D. J. Eleveld, P. Colin, A. R. Absalom, and M. M. R. F. Struys,
-                # “Pharmacokinetic–pharmacodynamic model for propofol for broad application in anaesthesia and sedation”
-                # British Journal of Anaesthesia, vol. 120, no. 5, pp. 942–959, mai 2018, doi:10.1016/j.bja.2018.01.018.
-
-                # reference patient
-                AGE_ref = 35
-                WGT_ref = 70
-                HGT_ref = 1.7
-                PMA_ref = (40+AGE_ref*52)/52  # not born prematurely and now 35 yo
-                BMI_ref = WGT_ref/HGT_ref**2
-                GDR_ref = 1  # 1 male, 0 female
-
-                theta = [None,                    # just to get same index than in the paper
-                         6.2830780766822,       # V1ref [l]
-                         25.5013145036879,      # V2ref [l]
-                         272.8166615043603,     # V3ref [l]
-                         1.7895836588902,       # Clref [l/min]
-                         1.7500983738779,       # Q2ref [l/min]
-                         1.1085424008536,       # Q3ref [l/min]
-                         0.191307,              # Typical residual error
-                         42.2760190602615,      # CL maturation E50
-                         9.0548452392807,       # CL maturation slope [weeks]
-                         -0.015633,             # Smaller V2 with age
-                         -0.00285709,           # Lower CL with age
-                         33.5531248778544,      # Weight for 50 % of maximal V1 [kg]
-                         -0.0138166,            # Smaller V3 with age
-                         68.2767978846832,      # Maturation of Q3 [weeks]
-                         2.1002218877899,       # CLref (female) [l/min]
-                         1.3042680471360,       # Higher Q2 for maturation of Q3
-                         1.4189043652084,       # V1 venous samples (children)
-                         0.6805003109141]       # Higer Q2 venous samples
-
-                # function used in the model
-                def faging(x): return np.exp(x * (age - AGE_ref))
-                def fsig(x, C50, gam): return x**gam/(C50**gam + x**gam)
-                def fcentral(x): return fsig(x, theta[12], 1)
-
-                def fal_sallami(sexX, weightX, ageX, bmiX):
-                    if sexX:
-                        return (0.88 + (1-0.88)/(1+(ageX/13.4)**(-12.7)))*(9270*weightX)/(6680+216*bmiX)
-                    else:
-                        return (1.11 + (1 - 1.11)/(1+(ageX/7.1)**(-1.1)))*(9270*weightX)/(8780+244*bmiX)
-
-                PMA = age + 40/52
-                BMI = weight/(height/100)**2
-
-                fCLmat = fsig(PMA * 52, theta[8], theta[9])
-                fCLmat_ref = fsig(PMA_ref*52, theta[8], theta[9])
-                fQ3mat = fsig(PMA * 52, theta[14], 1)
-                fQ3mat_ref = fsig(PMA_ref * 52, theta[14], 1)
-                fsal = fal_sallami(gender, weight, age, BMI)
-                fsal_ref = fal_sallami(GDR_ref, WGT_ref, AGE_ref, BMI_ref)
-
-                if opiate:
-                    def fopiate(x): return np.exp(x*age)
-                else:
-                    def fopiate(x): return 1
-
-                # reference: male, 70kg, 35 years and 170cm
-
-                v1 = theta[1] * fcentral(weight)/fcentral(WGT_ref)
-                if measurement == "venous":
-                    v1 = v1 * (1 + theta[17] * (1 - fcentral(weight)))
-                v2 = theta[2] * weight/WGT_ref * faging(theta[10])
-                v2ref = theta[2]
-                v3 = theta[3] * fsal/fsal_ref * fopiate(theta[13])
-                v3ref = theta[3]
-                cl1 = (gender*theta[4] + (1-gender)*theta[15]) * (weight/WGT_ref)**0.75 * \
-                    fCLmat/fCLmat_ref * fopiate(theta[11])
-
-                cl2 = theta[5]*(v2/v2ref)**0.75 * (1 + theta[16] * (1 - fQ3mat))
-                if measurement == "venous":
-                    cl2 = cl2*theta[18]
-
-                cl3 = theta[6] * (v3/v3ref)**0.75 * fQ3mat/fQ3mat_ref
-
-                ke0 = 0.146*(weight/70)**(-0.25)
-
-                # Coeff variability
-                cv_v1 = v1*0.917
-                cv_v2 = v2*0.871
-                cv_v3 = v3*0.904
-                cv_cl1 = cl1*0.551
-                cv_cl2 = cl2*0.643
-                cv_cl3 = cl3*0.482
-
-                # log normal standard deviation
-                w_v1 = np.sqrt(0.610)
-                w_v2 = np.sqrt(0.565)
-                w_v3 = np.sqrt(0.597)
-                w_cl1 = np.sqrt(0.265)
-                w_cl2 = np.sqrt(0.346)
-                w_cl3 = np.sqrt(0.209)
-                w_ke0 = np.sqrt(0.702)
-
-            # see C. Jeleazcov, M. Lavielle, J. Schüttler, and H. Ihmsen,
-            # “Pharmacodynamic response modelling of arterial blood pressure in adult
-            # volunteers during propofol anaesthesia,”
-            # BJA: British Journal of Anaesthesia, vol. 115, no. 2, pp. 213–226, Aug. 2015, doi: 10.1093/bja/aeu553.
-            ke1_map = 0.054
-            ke2_map = 0.0695
-            w_ke1_map = 1.5
-            w_ke2_map = 1.48
-
-        elif drug == "Remifentanil":
-            if model is None:
+            elif drug == "Remifentanil":
                 model = 'Minto'
-            if model == 'Minto':
-                #  see C. F. Minto et al., “Influence of Age and Gender on the Pharmacokinetics
-                # and Pharmacodynamics of Remifentanil: I. Model Development,”
-                # Anesthesiology, vol. 86, no. 1, pp. 10–23, Jan. 1997, doi: 10.1097/00000542-199701000-00004.
-
-                # Clearance Rates [l/min]
-                cl1 = 2.6 - 0.0162 * (age - 40) + 0.0191 * (lbm - 55)
-                cl2 = 2.05 - 0.0301 * (age - 40)
-                cl3 = 0.076 - 0.00113 * (age - 40)
-
-                # Volume of the compartmente [l]
-                v1 = 5.1 - 0.0201 * (age-40) + 0.072 * (lbm - 55)
-                v2 = 9.82 - 0.0811 * (age-40) + 0.108 * (lbm-55)
-                v3 = 5.42
-
-                ke0 = 0.595 - 0.007 * (age - 40)  # [1/min]
-
-                # variability
-                cv_v1 = 0.26
-                cv_v2 = 0.29
-                cv_v3 = 0.66
-                cv_cl1 = 0.14
-                cv_cl2 = 0.36
-                cv_cl3 = 0.41
-                cv_ke = 0.68
-
-                # estimation of log normal standard deviation
-                w_v1 = np.sqrt(np.log(1+cv_v1**2))
-                w_v2 = np.sqrt(np.log(1+cv_v2**2))
-                w_v3 = np.sqrt(np.log(1+cv_v3**2))
-                w_cl1 = np.sqrt(np.log(1+cv_cl1**2))
-                w_cl2 = np.sqrt(np.log(1+cv_cl2**2))
-                w_cl3 = np.sqrt(np.log(1+cv_cl3**2))
-                w_ke0 = np.sqrt(np.log(1+cv_ke**2))
-
-            elif model == 'Eleveld':
-                # see D. J. Eleveld et al., “An Allometric Model of Remifentanil Pharmacokinetics and Pharmacodynamics,”
-                # Anesthesiology, vol. 126, no. 6, pp. 1005–1018, juin 2017, doi: 10.1097/ALN.0000000000001634.
-
-                # function used in the model
-                def faging(x): return np.exp(x * (age - 35))
-                def fsig(x, C50, gam): return x**gam/(C50**gam + x**gam)
-
-                def fal_sallami(sexX, weightX, ageX, bmiX):
-                    if sexX:
-                        return (0.88 + (1-0.88)/(1+(ageX/13.4)**(-12.7)))*(9270*weightX)/(6680+216*bmiX)
-                    else:
-                        return (1.11 + (1 - 1.11)/(1+(ageX/7.1)**(-1.1)))*(9270*weightX)/(8780+244*bmiX)
-
-                # reference patient
-                AGE_ref = 35
-                WGT_ref = 70
-                HGT_ref = 1.7
-                PMA_ref = (40+AGE_ref*52)/52  # not born prematurely and now 35 yo
-                BMI_ref = WGT_ref/HGT_ref**2
-                GDR_ref = 1  # 1 male, 0 female
-
-                BMI = weight/(height/100)**2
-
-                SIZE = (fal_sallami(gender, weight, age, BMI)/fal_sallami(GDR_ref, WGT_ref, AGE_ref, BMI_ref))
-
-                theta = [None,      # Juste to have the same index as in the paper
-                         2.88,
-                         -0.00554,
-                         -0.00327,
-                         -0.0315,
-                         0.470,
-                         -0.0260]
-
-                KMAT = fsig(weight, theta[1], 2)
-                KMATref = fsig(WGT_ref, theta[1], 2)
-                if gender:
-                    KSEX = 1
-                else:
-                    KSEX = 1+theta[5]*fsig(age, 12, 6)*(1-fsig(age, 45, 6))
-
-                v1ref = 5.81
-                v1 = v1ref * SIZE * faging(theta[2])
-                V2ref = 8.882
-                v2 = V2ref * SIZE * faging(theta[3])
-                V3ref = 5.03
-                v3 = V3ref * SIZE * faging(theta[4])*np.exp(theta[6]*(weight - WGT_ref))
-                cl1ref = 2.58
-                cl2ref = 1.72
-                cl3ref = 0.124
-                cl1 = cl1ref * SIZE**0.75 * (KMAT/KMATref)*KSEX*faging(theta[3])
-                cl2 = cl2ref * (v2/V2ref)**0.75 * faging(theta[2]) * KSEX
-                cl3 = cl3ref * (v3/V3ref)**0.75 * faging(theta[2])
-
-                ke0 = 1.09 * faging(-0.0289)
-
-                # log normal standard deviation
-                w_v1 = np.sqrt(0.104)
-                w_v2 = np.sqrt(0.115)
-                w_v3 = np.sqrt(0.810)
-                w_cl1 = np.sqrt(0.0197)
-                w_cl2 = np.sqrt(0.0547)
-                w_cl3 = np.sqrt(0.285)
-                w_ke0 = np.sqrt(1.26)
-            # see J. F. Standing, G. B. Hammer, W. J. Sam, and D. R. Drover,
-            # “Pharmacokinetic–pharmacodynamic modeling of the hypotensive effect of
-            # remifentanil in infants undergoing cranioplasty,”
-            # Pediatric Anesthesia, vol. 20, no. 1, pp. 7–18, 2010, doi: 10.1111/j.1460-9592.2009.03174.x.
-            ke_map = 0.81
-            w_ke_map = 0.41
-        elif drug == 'Norepinephrine':
-            # see H. Beloeil, J.-X. Mazoit, D. Benhamou, and J. Duranteau, “Norepinephrine kinetics and dynamics
-            # in septic shock and trauma patients,” BJA: British Journal of Anaesthesia,
-            # vol. 95, no. 6, pp. 782–788, Dec. 2005, doi: 10.1093/bja/aei259.
-
-            v1 = 8.840
-            cl1 = 2  # suppose SAPS II = 30 ()
-
-            w_v1 = 1.63
-            w_cl1 = 0.974
-
-        if drug == 'Propofol':
-            # drug amount transfer rates [1/min]
-            k10 = cl1 / v1
-            k12 = cl2 / v1
-            k13 = cl3 / v1
-            k21 = cl2 / v2
-            k31 = cl3 / v3
-
-            # Nominal Matrices system definition
-            A_nom = np.array([[-(k10 + k12 + k13), k21, k31, 0, 0, 0],
-                              [k12, -k21, 0, 0, 0, 0],
-                              [k13, 0, -k31, 0, 0, 0],
-                              [ke0, 0, 0, -ke0, 0, 0],
-                              [ke1_map, 0, 0, 0, -ke1_map, 0],
-                              [ke2_map, 0, 0, 0, 0, -ke2_map]])/60  # 1/s
-
-            B_nom = np.transpose(np.array([[1/v1, 0, 0, 0, 0, 0]]))  # 1/L
-            C = np.array([[0, 0, 0, 1, 0, 0]])
-            D = np.array([[0]])
-
-            # Introduce inter-patient variability
-            if random is True:
-                if model == 'Marsh':
-                    print("Warning: the standard deviation of the Marsh model are not know," +
-                          " it is set to 100% for each variable")
-
-                v1 *= np.exp(np.random.normal(scale=w_v1))
-                v2 *= np.exp(np.random.normal(scale=w_v2))
-                v3 *= np.exp(np.random.normal(scale=w_v3))
-                cl1 *= np.exp(np.random.normal(scale=w_cl1))
-                cl2 *= np.exp(np.random.normal(scale=w_cl2))
-                cl3 *= np.exp(np.random.normal(scale=w_cl3))
-                ke0 *= np.exp(np.random.normal(scale=w_ke0))
-                ke1_map *= np.exp(np.random.normal(scale=w_ke1_map))
-                ke2_map *= np.exp(np.random.normal(scale=w_ke2_map))
-
-                # random Matrices system definition
-                A = np.array([[-(k10 + k12 + k13), k21, k31, 0, 0, 0],
-                              [k12, -k21, 0, 0, 0, 0],
-                              [k13, 0, -k31, 0, 0, 0],
-                              [ke0, 0, 0, -ke0, 0, 0],
-                              [ke1_map, 0, 0, 0, -ke1_map, 0],
-                              [ke2_map, 0, 0, 0, 0, -ke2_map]])/60  # 1/s
-
-                B = np.transpose(np.array([[1/v1, 0, 0, 0, 0, 0]]))  # 1/L
-            else:
-                A = A_nom
-                B = B_nom
-        elif drug == 'Remifentanil':
-            # drug amount transfer rates [1/min]
-            k10 = cl1 / v1
-            k12 = cl2 / v1
-            k13 = cl3 / v1
-            k21 = cl2 / v2
-            k31 = cl3 / v3
-
-            # Nominal Matrices system definition
-            A_nom = np.array([[-(k10 + k12 + k13), k21, k31, 0, 0],
-                              [k12, -k21, 0, 0, 0],
-                              [k13, 0, -k31, 0, 0],
-                              [ke0, 0, 0, -ke0, 0],
-                              [ke_map, 0, 0, 0, -ke_map]])/60  # 1/s
-
-            B_nom = np.transpose(np.array([[1/v1, 0, 0, 0, 0]]))  # 1/L
-            C = np.array([[0, 0, 0, 1, 0]])
-            D = np.array([[0]])
-
-            # Introduce inter-patient variability
-            if random is True:
-                if model == 'Marsh':
-                    print("Warning: the standard deviation of the Marsh model are not know," +
-                          " it is set to 100% for each variable")
-
-                v1 *= np.exp(np.random.normal(scale=w_v1))
-                v2 *= np.exp(np.random.normal(scale=w_v2))
-                v3 *= np.exp(np.random.normal(scale=w_v3))
-                cl1 *= np.exp(np.random.normal(scale=w_cl1))
-                cl2 *= np.exp(np.random.normal(scale=w_cl2))
-                cl3 *= np.exp(np.random.normal(scale=w_cl3))
-                ke0 *= np.exp(np.random.normal(scale=w_ke0))
-                ke_map *= np.exp(np.random.normal(scale=w_ke_map))
-                A = np.array([[-(k10 + k12 + k13), k21, k31, 0, 0],
-                              [k12, -k21, 0, 0, 0],
-                              [k13, 0, -k31, 0, 0],
-                              [ke0, 0, 0, -ke0, 0],
-                              [ke_map, 0, 0, 0, -ke_map]])/60  # 1/s
-
-                B = np.transpose(np.array([[1/v1, 0, 0, 0, 0]]))  # 1/L
-            else:
-                A = A_nom
-                B = B_nom
-        elif drug == 'Norepinephrine':
-            # drug amount transfer rates [1/min]
-            k10 = cl1 / v1
-
-            # Nominal Matrices system definition
-            A_nom = np.array([-k10])/60  # 1/s
-
-            B_nom = np.array([1/v1])  # 1/L
-            C = np.array([1])
-            D = np.array([0])
-            if random is True:
-                v1 *= np.exp(np.random.normal(scale=w_v1))
-                cl1 *= np.exp(np.random.normal(scale=w_cl1))
-
-                A = np.array([-k10])/60  # 1/s
-                B = np.array([1/v1])  # 1/L
-            else:
-                A = A_nom
-                B = B_nom
+        params = _pk_params(drug, model, age, height, weight, gender, lbm, opiate, measurement)
+
+        # Introduce inter-patient variability
+        if random is True:
+            if model == 'Marsh':
+                print("Warning: the standard deviation of the Marsh model are not know," +
+                      " it is set to 100% for each variable")
+            # sample all the log-normal multipliers in a single draw and
+            # rebuild the matrices from the perturbed parameters
+            keys = [k for k in params if not k.startswith('w_')]
+            w = np.array([params['w_' + k] for k in keys])
+            mul = np.exp(self._rng.normal(scale=w))
+            params = dict(params)
+            for k, m in zip(keys, mul):
+                params[k] = params[k] * m
+        A, B, C, D = _pk_matrices(drug, params)
         self.A_init = A
         self.B_init = B
-        self.v1 = v1
+        self.v1 = params['v1']
         self.drug = drug
-        # Continuous system with blood concentration as output
-        self.continuous_sys = control.ss(A, B, C, D)
-        # Discretization of the system
-        self.discretize_sys = self.continuous_sys.sample(self.ts)
+        # Continuous system matrices with blood concentration as output
+        self.A = A
+        self.B = B
+        self.C = C
+        self.D = D
+        # Discretization of the system with a zero-order hold
+        self._co_cache = {}
+        self._bl_cache = {}
+        # counter bumped every time Ad, Bd change, used by the Patient class
+        # to detect stale fused block matrices
+        self._version = 0
+        self._discretize(A, B)
 
         # init output
         if x0 is None:
-            x0 = np.zeros(len(A))  # np.ones(len(A))*1e-3
+            x0 = np.zeros(A.shape[0])  # np.ones(A.shape[0])*1e-3
         self.x = x0
+        # scratch buffers reused by one_step so that stepping never allocates
+        self._x_tmp = np.empty(A.shape[0])
+        self._y_buf = np.empty(1)
+        # C is a one-hot selector row, the output is simply one state
+        self._iy = int(np.argmax(C))
         self.y = np.dot(C, self.x)
 
+    def _discretize(self, A: np.ndarray, B: np.ndarray):
+        """Compute the zero-order-hold discretization Ad, Bd of the continuous system (A, B).
+
+        Ad and Bd are obtained in one shot from the exponential of the augmented
+        matrix [[A, B], [0, 0]]. The lazy control.StateSpace wrappers are
+        invalidated, they will be rebuilt at their next access.
+        """
+        nx = A.shape[0]
+        if nx == 1:
+            # One-compartment model (norepinephrine): the ZOH solution is scalar
+            a = A[0, 0]
+            ad = exp(a * self.ts)
+            self.Ad = np.array([[ad]])
+            self.Bd = np.array([(ad - 1) / a * B[0, 0]] if a != 0 else [B[0, 0] * self.ts])
+        else:
+            E = _expm_pk(np.block([[A, B], [np.zeros((1, nx + 1))]]) * self.ts)
+            self.Ad = np.ascontiguousarray(E[:nx, :nx])
+            self.Bd = np.ascontiguousarray(E[:nx, nx])
+        self._continuous_sys = None
+        self._discretize_sys = None
+        self._dcgain = None
+        self._x_eq_unit = None
+        self._version += 1
+
+    @property
+    def x_eq_unit(self) -> np.ndarray:
+        """Steady state of the model for a unit constant input, cached until A or B changes.
+
+        The equilibrium state for an input u is simply x_eq_unit * u.
+        """
+        if self._x_eq_unit is None:
+            self._x_eq_unit = np.linalg.solve(-self.A, self.B).ravel()
+        return self._x_eq_unit
+
+    @property
+    def dcgain(self) -> float:
+        """Static gain of the continuous system, cached until A or B changes.
+
+        Equivalent to control.dcgain(self.continuous_sys) without building
+        the StateSpace wrapper.
+        """
+        if self._dcgain is None:
+            self._dcgain = (self.C @ np.linalg.solve(-self.A, self.B) + self.D).item()
+        return self._dcgain
+
+    @property
+    def continuous_sys(self):
+        """Return the continuous control.StateSpace model, build it at the first access."""
+        if self._continuous_sys is None:
+            import control
+            self._continuous_sys = control.ss(self.A, self.B, self.C, self.D)
+        return self._continuous_sys
+
+    @property
+    def discretize_sys(self):
+        """Return the discrete control.StateSpace model, build it at the first access."""
+        if self._discretize_sys is None:
+            self._discretize_sys = self.continuous_sys.sample(self.ts)
+        return self._discretize_sys
+
+    @classmethod
+    def batch(cls, Patient_characteristics: list, lbm: list, drug: str,
+              model: str = None, ts: float = 1,
+              opiate=True, measurement="arterial") -> tuple:
+        """Compute the discrete dynamics of a whole cohort of patients in one pass.
+
+        The nominal parameters of each patient are derived (and memoized) with
+        _pk_params while the discretization of the whole cohort is performed
+        with a single batched matrix exponential, instead of building N
+        state-space objects.
+
+        Parameters
+        ----------
+        Patient_characteristics : list
+            List of [age (yr), height(cm), weight(kg), gender(0: female, 1: male)], one per patient.
+        lbm : list
+            Lean body mass of each patient.
+        drug : str
+            can be "Propofol", "Remifentanil" or "Norepinephrine".
+        model : str, optional
+            Same options than for the constructor. The default is
+            "Minto" for Remifentanil and "Schnider" for Propofol.
+        ts : float, optional
+            Sampling time, in s. The default is 1.
+        opiate : bool, optional
+            See the constructor. The default is True.
+        measurement : str, optional
+            See the constructor. The default is 'arterial'.
+
+        Returns
+        -------
+        Ad_all : numpy array of shape (N, nx, nx)
+            Discrete dynamic matrix of each patient.
+        Bd_all : numpy array of shape (N, nx)
+            Discrete input matrix of each patient.
+        C : numpy array
+            Output matrix, shared by the whole cohort.
+
+        """
+        if model is None:
+            if drug == "Propofol":
+                model = 'Schnider'
+            elif drug == "Remifentanil":
+                model = 'Minto'
+        A_all = []
+        B_all = []
+        for characteristic, lbm_i in zip(Patient_characteristics, lbm):
+            age, height, weight, gender = characteristic
+            params = _pk_params(drug, model, age, height, weight, gender, lbm_i, opiate, measurement)
+            A, B, C, D = _pk_matrices(drug, params)
+            A_all.append(A)
+            B_all.append(B[:, 0])
+        A_all = np.stack(A_all)
+        B_all = np.stack(B_all)
+        # Discretization of the whole cohort with a single batched matrix exponential
+        n_patient, nx = B_all.shape
+        M = np.zeros((n_patient, nx + 1, nx + 1))
+        M[:, :nx, :nx] = A_all
+        M[:, :nx, nx] = B_all
+        E = expm(M * ts)
+        Ad_all = np.ascontiguousarray(E[:, :nx, :nx])
+        Bd_all = np.ascontiguousarray(E[:, :nx, nx])
+        return Ad_all, Bd_all, C
+
+    @staticmethod
+    def vectorized_step(Ad_all: np.ndarray, Bd_all: np.ndarray,
+                        x_all: np.ndarray, u_all: np.ndarray) -> np.ndarray:
+        """Advance a whole cohort of discrete PK models by one step.
+
+        .. math:: x_i^+ = A_{d,i} x_i + B_{d,i} u_i
+
+        Parameters
+        ----------
+        Ad_all : numpy array of shape (N, nx, nx)
+            Discrete dynamic matrix of each patient, as returned by batch().
+        Bd_all : numpy array of shape (N, nx)
+            Discrete input matrix of each patient, as returned by batch().
+        x_all : numpy array of shape (N, nx)
+            Current state of each patient.
+        u_all : numpy array of shape (N,)
+            Infusion rate of each patient.
+
+        Returns
+        -------
+        numpy array of shape (N, nx)
+            Next state of each patient.
+
+        """
+        return np.einsum('nij,nj->ni', Ad_all, x_all) + Bd_all * np.asarray(u_all)[:, None]
+
     def one_step(self, u: float) -> list:
         """Simulate one step of PK model.
 
@@ -580,8 +852,42 @@ class CompartmentModel:
             Actual effect site concentration (µg/mL for Propofol and ng/mL for Remifentanil).
 
         """
-        self.x = self.discretize_sys.dynamics(None, self.x, u=u)  # first input is ignored
-        self.y = self.discretize_sys.output(None, self.x, u=u)  # first input is ignored
+        x = self.x
+        if x.ndim != 1:
+            # initialized_at_given_input assigns a column vector
+            x = np.ravel(x)
+        # step into the scratch buffer, then swap it with the state;
+        # controllers routinely pass the input as a one-element array
+        self.x = _step(self.Ad, self.Bd, x, np.asarray(u).item(), self._x_tmp)
+        self._x_tmp = x
+        # C only selects one state, no need for a matrix product
+        self._y_buf[0] = self.x[self._iy]
+        self.y = self._y_buf
+        return self.y
+
+    def sync_state(self, x: np.ndarray) -> np.ndarray:
+        """Set the state from an externally computed step and refresh the output.
+
+        Used by the fused block-diagonal step of the Patient class, which
+        advances all its PK models in a single kernel call. The state is
+        copied in place so that external references stay valid.
+
+        Parameters
+        ----------
+        x : numpy array
+            New state vector.
+
+        Returns
+        -------
+        numpy array
+            Actual effect site concentration (µg/mL for Propofol and ng/mL for Remifentanil).
+
+        """
+        if self.x.ndim != 1:
+            self.x = np.ravel(self.x)
+        self.x[:] = x
+        self._y_buf[0] = self.x[self._iy]
+        self.y = self._y_buf
         return self.y
 
     def update_param_CO(self, CO_ratio: float):
@@ -596,17 +902,33 @@ class CompartmentModel:
         -------
         None.
 
+        Notes
+        -----
+        The ratio is quantized with a 1e-3 resolution and the resulting
+        matrices are cached: simulations where the cardiac output hovers
+        around a few values only pay the discretization once per value.
         """
-        coeff = 1
-        Anew = copy.deepcopy(self.A_init)
+        key = round(np.asarray(CO_ratio).item() * 1000)
+        cached = self._co_cache.get(key)
+        if cached is not None:
+            self.A, self.Ad, self.Bd = cached
+            self._continuous_sys = None
+            self._discretize_sys = None
+            self._dcgain = None
+            self._x_eq_unit = None
+            self._version += 1
+            return
+        ratio = key / 1000
+        Anew = self.A_init.copy()
         if self.drug == 'Propofol' or self.drug == 'Remifentanil':
-            Anew[:3, :3] = coeff * Anew[:3, :3] * CO_ratio
+            Anew[:3, :3] = Anew[:3, :3] * ratio
         else:
-            Anew = Anew * coeff * CO_ratio
+            Anew = Anew * ratio
         # Continuous system with blood concentration as output
-        self.continuous_sys = control.ss(Anew, self.continuous_sys.B, self.continuous_sys.C, self.continuous_sys.D)
+        self.A = Anew
         # Discretization of the system
-        self.discretize_sys = self.continuous_sys.sample(self.ts)
+        self._discretize(Anew, self.B)
+        self._co_cache[key] = (Anew, self.Ad, self.Bd)
 
     def update_param_blood_loss(self, v_ratio: float):
         """Update PK coefficient to mimic a blood loss.
@@ -622,18 +944,38 @@ class CompartmentModel:
         -------
         None.
 
+        Notes
+        -----
+        As in update_param_CO, the ratio is quantized with a 1e-3 resolution
+        and the resulting matrices are cached, so revisited volume levels skip
+        the discretization.  The matrices always derive from the initial ones,
+        which makes the cache valid for the lifetime of the model.
         """
-        Bnew = copy.deepcopy(self.B_init)
-        Anew = copy.deepcopy(self.A_init)
+        key = round(np.asarray(v_ratio).item() * 1000)
+        cached = self._bl_cache.get(key)
+        if cached is not None:
+            self.A, self.B, self.Ad, self.Bd = cached
+            self._continuous_sys = None
+            self._discretize_sys = None
+            self._dcgain = None
+            self._x_eq_unit = None
+            self._co_cache.clear()
+            self._version += 1
+            return
+        ratio = key / 1000
+        Bnew = self.B_init.copy()
+        Anew = self.A_init.copy()
         if self.drug == 'Propofol' or self.drug == 'Remifentanil':
-            Anew[0][0] /= v_ratio
-            Anew[1][0] /= v_ratio
-            Anew[2][0] /= v_ratio
+            Anew[:3, 0] /= ratio
         else:
-            Anew /= v_ratio
-        Bnew /= v_ratio
+            Anew /= ratio
+        Bnew /= ratio
 
         # Continuous system with blood concentration as output
-        self.continuous_sys = control.ss(Anew, Bnew, self.continuous_sys.C, self.continuous_sys.D)
+        self.A = Anew
+        self.B = Bnew
         # Discretization of the system
-        self.discretize_sys = self.continuous_sys.sample(self.ts)
+        self._discretize(Anew, Bnew)
+        self._bl_cache[key] = (Anew, Bnew, self.Ad, self.Bd)
+        # B changed, the cached CO discretizations are no longer valid
+        self._co_cache.clear()
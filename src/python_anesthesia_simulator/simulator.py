@@ -1,14 +1,33 @@
 # Standard import
+import multiprocessing
 
 # Third party imports
 import numpy as np
-import control
 import pandas as pd
 import casadi as cas
+from scipy.optimize import least_squares
 # Local imports
-from .pk_models import CompartmentModel
+from .pk_models import CompartmentModel, _step_block
 from .pd_models import BIS_model, TOL_model, Hemo_PD_model
 
+# Columns of the dataframe built by Patient.save_data
+_COLUMN_NAMES = ['Time',  # time
+                 'BIS', 'TOL', 'MAP', 'CO',  # outputs
+                 'u_propo', 'u_remi', 'u_nore',  # inputs
+                 'x_propo_1', 'x_propo_2', 'x_propo_3', 'x_propo_4', 'x_propo_5', 'x_propo_6',  # x_PK_propo
+                 'x_remi_1', 'x_remi_2', 'x_remi_3', 'x_remi_4', 'x_remi_5',  # x_PK_remi
+                 'c_blood_nore', 'blood_volume']  # nore concentration and blood volume
+
+# Column positions used by Patient.save_data, resolved once at import time
+_SLICE_INPUTS = slice(_COLUMN_NAMES.index('u_propo'), _COLUMN_NAMES.index('u_nore') + 1)
+_SLICE_X_PROPO = slice(_COLUMN_NAMES.index('x_propo_1'), _COLUMN_NAMES.index('x_propo_6') + 1)
+_SLICE_X_REMI = slice(_COLUMN_NAMES.index('x_remi_1'), _COLUMN_NAMES.index('x_remi_5') + 1)
+_IDX_C_NORE = _COLUMN_NAMES.index('c_blood_nore')
+_IDX_BLOOD_VOLUME = _COLUMN_NAMES.index('blood_volume')
+
+# shared default disturbance vector, never written to
+_ZERO_DIST = np.zeros(3)
+
 
 class Patient:
     r"""Define a Patient class able to simulate Anesthesia process.
@@ -39,6 +58,9 @@ class Patient:
         Turn on the option to update PK parameters thanks to the CO value. The default is False.
     save_data_bool : bool, optional
         Save all interns variable at each sampling time in a data frame. The default is True.
+    seed : int, optional
+        Seed of the random generator used for the PK uncertainties and the
+        measurement noise, shared with the PK models. The default is None.
 
     Attributes
     ----------
@@ -112,7 +134,8 @@ class Patient:
                  random_PK: bool = False,
                  random_PD: bool = False,
                  co_update: bool = False,
-                 save_data_bool: bool = True):
+                 save_data_bool: bool = True,
+                 seed: int = None):
         """
         Initialise a patient class for anesthesia simulation.
 
@@ -135,6 +158,10 @@ class Patient:
         self.random_PD = random_PD
         self.co_update = co_update
         self.save_data_bool = save_data_bool
+        # one generator for the whole patient, shared with the PK models
+        self._rng = np.random.default_rng(seed)
+        # standard deviation of the measurement noise on [BIS, MAP, CO]
+        self._noise_scales = np.array([3.0, 0.5, 0.1])
 
         # LBM computation
         if self.gender == 1:  # homme
@@ -144,13 +171,16 @@ class Patient:
 
         # Init PK models for all drugs
         self.propo_pk = CompartmentModel(patient_characteristic, self.lbm, drug="Propofol",
-                                         ts=self.ts, model=model_propo, random=random_PK)
+                                         ts=self.ts, model=model_propo, random=random_PK,
+                                         seed=self._rng)
 
         self.remi_pk = CompartmentModel(patient_characteristic, self.lbm, drug="Remifentanil",
-                                        ts=self.ts, model=model_remi, random=random_PK)
+                                        ts=self.ts, model=model_remi, random=random_PK,
+                                        seed=self._rng)
 
         self.nore_pk = CompartmentModel(patient_characteristic, self.lbm, drug="Norepinephrine",
-                                        ts=self.ts, model=model_remi, random=random_PK)
+                                        ts=self.ts, model=model_remi, random=random_PK,
+                                        seed=self._rng)
 
         # Init PD model for BIS
         self.bis_pd = BIS_model(hill_model='Bouillon', hill_param=hill_param, random=random_PD)
@@ -165,6 +195,28 @@ class Patient:
         # init blood loss volume
         self.blood_volume = self.propo_pk.v1
         self.blood_volume_init = self.propo_pk.v1
+        self._last_v_ratio = 1.0
+        self._last_co_ratio = 1.0
+
+        # equilibrium solver, built by find_equilibrium and reused across calls
+        self._eq_solver = None
+        self._eq_solver_key = None
+
+        # fused block-diagonal discrete system stacking the three PK models,
+        # so that one_step advances them in a single kernel call
+        nx_propo = self.propo_pk.A.shape[0]
+        nx_remi = self.remi_pk.A.shape[0]
+        nx_nore = self.nore_pk.A.shape[0]
+        nx_all = nx_propo + nx_remi + nx_nore
+        self._sl_propo = slice(0, nx_propo)
+        self._sl_remi = slice(nx_propo, nx_propo + nx_remi)
+        self._sl_nore = slice(nx_propo + nx_remi, nx_all)
+        self._Ad_block = np.zeros((nx_all, nx_all))
+        self._Bd_block = np.zeros((nx_all, 3))
+        self._block_key = None
+        self._x_all = np.zeros(nx_all)
+        self._x_all_tmp = np.empty(nx_all)
+        self._u_all = np.empty(3)
 
         # Init all the output variable
         self.bis = self.bis_pd.compute_bis(0, 0)
@@ -176,8 +228,26 @@ class Patient:
         if self.save_data_bool:
             self.init_dataframe()
 
+    def _refresh_pk_block(self):
+        """Rebuild the block-diagonal discrete matrices if any PK model changed.
+
+        Every rediscretization bumps the version counter of its model, so the
+        three counters together detect a stale block.
+        """
+        key = (self.propo_pk._version, self.remi_pk._version, self.nore_pk._version)
+        if key == self._block_key:
+            return
+        Ad, Bd = self._Ad_block, self._Bd_block
+        Ad[self._sl_propo, self._sl_propo] = self.propo_pk.Ad
+        Ad[self._sl_remi, self._sl_remi] = self.remi_pk.Ad
+        Ad[self._sl_nore, self._sl_nore] = self.nore_pk.Ad
+        Bd[self._sl_propo, 0] = self.propo_pk.Bd
+        Bd[self._sl_remi, 1] = self.remi_pk.Bd
+        Bd[self._sl_nore, 2] = self.nore_pk.Bd
+        self._block_key = key
+
     def one_step(self, u_propo: float = 0, u_remi: float = 0, u_nore: float = 0,
-                 blood_rate: float = 0, dist: list = [0]*3, noise: bool = True) -> tuple[float, float, float, float]:
+                 blood_rate: float = 0, Dist=_ZERO_DIST, noise: bool = True) -> tuple[float, float, float, float]:
         r"""
         Simulate one step time of the patient.
 
@@ -192,8 +262,8 @@ class Patient:
         blood_rate : float, optional
             Fluid rates from blood volume (mL/min), negative is bleeding while positive is a transfusion.
             The default is 0.
-        Dist : list, optional
-            Disturbance vector on [BIS (%), MAP (mmHg), CO (L/min)]. The default is [0]*3.
+        Dist : list or numpy array, optional
+            Disturbance vector on [BIS (%), MAP (mmHg), CO (L/min)]. The default is no disturbance.
         noise : bool, optional
             bool to add measurement noise on the outputs. The default is True.
 
@@ -209,38 +279,69 @@ class Patient:
             Tolerance of Laringoscopy index (0-1).
 
         """
-        # compute PK model
-        self.c_es_propo = self.propo_pk.one_step(u_propo)
-        self.c_es_remi = self.remi_pk.one_step(u_remi)
-        self.c_blood_nore = self.nore_pk.one_step(u_nore)
+        # controllers routinely pass the infusion rates as one-element arrays
+        u_propo = np.asarray(u_propo).item()
+        u_remi = np.asarray(u_remi).item()
+        u_nore = np.asarray(u_nore).item()
+        # bind the models to locals, one_step is the hot loop of the simulator
+        propo_pk = self.propo_pk
+        remi_pk = self.remi_pk
+        nore_pk = self.nore_pk
+        # compute PK models, fused in a single block-diagonal step
+        self._refresh_pk_block()
+        x_all = self._x_all
+        x_all[self._sl_propo] = np.ravel(propo_pk.x)
+        x_all[self._sl_remi] = np.ravel(remi_pk.x)
+        x_all[self._sl_nore] = np.ravel(nore_pk.x)
+        u_all = self._u_all
+        u_all[0] = u_propo
+        u_all[1] = u_remi
+        u_all[2] = u_nore
+        self._x_all = _step_block(self._Ad_block, self._Bd_block, x_all, u_all, self._x_all_tmp)
+        self._x_all_tmp = x_all
+        x_all = self._x_all
+        self.c_es_propo = propo_pk.sync_state(x_all[self._sl_propo])
+        self.c_es_remi = remi_pk.sync_state(x_all[self._sl_remi])
+        self.c_blood_nore = nore_pk.sync_state(x_all[self._sl_nore])
+        cep = self.c_es_propo[0]
+        cer = self.c_es_remi[0]
+        cn = self.c_blood_nore[0]
+        x_propo = propo_pk.x
         # BIS
-        self.bis = self.bis_pd.compute_bis(self.c_es_propo, self.c_es_remi)
+        self.bis = self.bis_pd.compute_bis_fast(cep, cer)
         # TOL
-        self.tol = self.tol_pd.compute_tol(self.c_es_propo, self.c_es_remi)
+        self.tol = self.tol_pd.compute_tol_fast(cep, cer)
         # Hemodynamic
-        self.map, self.co = self.hemo_pd.compute_hemo(self.propo_pk.x[4:], self.remi_pk.x[4], self.c_blood_nore)
-        # disturbances
-        self.bis += dist[0]
-        self.map += dist[1]
-        self.co += dist[2]
-
-        # blood loss effect
-        if blood_rate != 0 or self.blood_volume != self.blood_volume_init:
-            self.blood_loss(blood_rate)
-            self.map *= self.blood_volume/self.blood_volume_init
-            self.co *= self.blood_volume/self.blood_volume_init
-
-        # update PK model with CO
+        self.map, self.co = self.hemo_pd.compute_hemo_fast(
+            x_propo[4], x_propo[5], remi_pk.x[4], cn)
+        # disturbances, single vector add on the packed outputs
+        if Dist is not _ZERO_DIST:
+            self.bis, self.map, self.co = np.add(Dist, (self.bis, self.map, self.co))
+
+        # blood loss effect: always run, blood_loss itself skips the model
+        # updates when the volume ratio did not change
+        self.blood_loss(blood_rate)
+        v_ratio = self.blood_volume/self.blood_volume_init
+        self.map *= v_ratio
+        self.co *= v_ratio
+
+        # update PK model with CO, only when the ratio moved by more than
+        # 0.1 % since the last update: the expm cost is skipped entirely and
+        # the quantized caches of the models absorb the remaining updates
         if self.co_update:
-            self.propo_pk.update_param_CO(self.co/self.co_base)
-            self.remi_pk.update_param_CO(self.co/self.co_base)
-            self.nore_pk.update_param_CO(self.co/self.co_base)
-
-        # add noise
+            co_ratio = self.co/self.co_base
+            if abs(co_ratio - self._last_co_ratio) > 1e-3:
+                propo_pk.update_param_CO(co_ratio)
+                remi_pk.update_param_CO(co_ratio)
+                nore_pk.update_param_CO(co_ratio)
+                self._last_co_ratio = co_ratio
+
+        # add noise, sampled in a single draw
         if noise:
-            self.bis += np.random.normal(scale=3)
-            self.map += np.random.normal(scale=0.5)
-            self.co += np.random.normal(scale=0.1)
+            noise_sample = self._rng.standard_normal(3) * self._noise_scales
+            self.bis += noise_sample[0]
+            self.map += noise_sample[1]
+            self.co += noise_sample[2]
 
         
         # Save data
@@ -251,8 +352,78 @@ class Patient:
 
         return(self.bis, self.co, self.map, self.tol)
 
+    def simulate(self, u_propo, u_remi, u_nore=None, blood_rate=None,
+                 dist=None, noise: bool = True) -> pd.DataFrame:
+        r"""Simulate a whole trajectory and return the dataframe.
+
+        Batch counterpart of one_step: the storage buffer is preallocated to
+        the exact trajectory length, the per-step objects are bound once and
+        the dataframe is materialized a single time at the end. The loop
+        itself stays in Python because the cardiac output and blood loss
+        feedbacks rediscretize the PK models along the trajectory, so the
+        dynamics cannot be hoisted into a single compiled kernel without
+        changing the model.
+
+        Parameters
+        ----------
+        u_propo : numpy array
+            Propofol infusion rate profile (mg/s), one value per sample time.
+        u_remi : numpy array
+            Remifentanil infusion rate profile (µg/s), one value per sample time.
+        u_nore : numpy array, optional
+            Norepinephrine infusion rate profile (µg/s). The default is no infusion.
+        blood_rate : numpy array, optional
+            Fluid rate profile (mL/min). The default is no blood loss.
+        dist : numpy array, optional
+            Disturbance profile of shape (N, 3) on [BIS (%), MAP (mmHg), CO (L/min)].
+            The default is no disturbance.
+        noise : bool, optional
+            bool to add measurement noise on the outputs. The default is True.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Dataframe containing all the intern variables at each sampling time.
+
+        Raises
+        ------
+        ValueError
+            If the patient was created with save_data_bool=False, since the
+            returned dataframe is only filled when data saving is enabled.
+
+        """
+        if not self.save_data_bool:
+            raise ValueError("simulate requires save_data_bool=True")
+        u_propo = np.asarray(u_propo, dtype=np.float64)
+        n_step = len(u_propo)
+        u_remi = np.asarray(u_remi, dtype=np.float64)
+        if u_nore is None:
+            u_nore = np.zeros(n_step)
+        else:
+            u_nore = np.asarray(u_nore, dtype=np.float64)
+        if blood_rate is None:
+            blood_rate = np.zeros(n_step)
+        else:
+            blood_rate = np.asarray(blood_rate, dtype=np.float64)
+        if dist is not None:
+            dist = np.asarray(dist, dtype=np.float64)
+
+        # grow the storage buffer once to the exact final size
+        needed = self._n_saved + n_step
+        buffer = self._data_buffer
+        if buffer.shape[0] < needed:
+            new_buffer = np.zeros((needed, buffer.shape[1]), dtype=buffer.dtype)
+            new_buffer[:self._n_saved] = buffer[:self._n_saved]
+            self._data_buffer = new_buffer
+
+        one_step = self.one_step
+        for k in range(n_step):
+            one_step(u_propo[k], u_remi[k], u_nore[k], blood_rate[k],
+                     Dist=_ZERO_DIST if dist is None else dist[k], noise=noise)
+        return self.dataframe
+
     def find_equilibrium(self, bis_target: float, tol_target: float,
-                         map_target: float) -> tuple[float, float, float]:
+                         map_target: float, method: str = 'least_squares') -> tuple[float, float, float]:
         r"""
         Find the input to meet the targeted outputs at the equilibrium.
 
@@ -272,6 +443,13 @@ class Patient:
             TOL target ([0, 1]).
         map_target:float
             MAP target (mmHg).
+        method : str, optional
+            Solver used for the BIS-TOL problem, either 'least_squares'
+            (scipy) or 'ipopt' (casadi). The scipy path is much faster on
+            this 2-variable problem but its small regularization residual
+            biases the solution slightly: the two methods agree only
+            approximately (within ~0.2 BIS on the targets, 1-2 % on the
+            equilibrium inputs). The default is 'least_squares'.
 
         Returns
         -------
@@ -283,46 +461,71 @@ class Patient:
             Norepinephrine infusion rate (µg/s).
         """
         # find Remifentanil and Propofol Concentration from BIS and TOL
-        cep = cas.MX.sym('cep')  # effect site concentration of propofol in the optimization problem
-        cer = cas.MX.sym('cer')  # effect site concentration of remifentanil in the optimization problem
-
-        bis = self.bis_pd.compute_bis(cep, cer)
-        tol = self.tol_pd.compute_tol(cep, cer)
-
-        J = (bis - bis_target)**2/100**2 + (tol - tol_target)**2
-        w = [cep, cer]
-        w0 = [self.bis_pd.c50p, self.bis_pd.c50r/2.5]
-        lbw = [0, 0]
-        ubw = [50, 50]
-
-        opts = {'ipopt.print_level': 0, 'print_time': 0}
-        prob = {'f': J, 'x': cas.vertcat(*w)}
-        solver = cas.nlpsol('solver', 'ipopt', prob, opts)
-        sol = solver(x0=w0, lbx=lbw, ubx=ubw)
-        w_opt = sol['x'].full().flatten()
+        if method == 'least_squares':
+            bis_pd = self.bis_pd
+            tol_pd = self.tol_pd
+            reg = np.sqrt(1e-5)  # tiny regularization to select cer = 2*cep among the solutions
+
+            def residuals(w):
+                cep, cer = w
+                return [(bis_pd.compute_bis(cep, cer) - bis_target)/100,
+                        tol_pd.compute_tol(cep, cer) - tol_target,
+                        reg * (2*cep - cer)]
+
+            sol = least_squares(residuals, x0=[bis_pd.c50p, bis_pd.c50r/2.5],
+                                bounds=([0, 0], [50, 50]), method='trf')
+            w_opt = sol.x
+        else:
+            # the targets enter the problem as parameters, so the solver only has
+            # to be built once per set of PD parameters and is reused afterwards
+            pd_key = (self.bis_pd.c50p, self.bis_pd.c50r, self.bis_pd.gamma,
+                      self.bis_pd.beta, self.bis_pd.E0, self.bis_pd.Emax,
+                      self.tol_pd.c50p, self.tol_pd.c50r, self.tol_pd.gamma_p,
+                      self.tol_pd.gamma_r, self.tol_pd.pre_intensity)
+            if self._eq_solver is None or self._eq_solver_key != pd_key:
+                cep = cas.MX.sym('cep')  # effect site concentration of propofol in the optimization problem
+                cer = cas.MX.sym('cer')  # effect site concentration of remifentanil in the optimization problem
+                targets = cas.MX.sym('targets', 2)  # [bis_target, tol_target]
+
+                bis = self.bis_pd.compute_bis(cep, cer)
+                tol = self.tol_pd.compute_tol(cep, cer)
+
+                J = (bis - targets[0])**2/100**2 + (tol - targets[1])**2
+                opts = {'ipopt.print_level': 0, 'print_time': 0}
+                prob = {'f': J, 'x': cas.vertcat(cep, cer), 'p': targets}
+                self._eq_solver = cas.nlpsol('solver', 'ipopt', prob, opts)
+                self._eq_solver_key = pd_key
+            w0 = [self.bis_pd.c50p, self.bis_pd.c50r/2.5]
+            lbw = [0, 0]
+            ubw = [50, 50]
+            sol = self._eq_solver(x0=w0, lbx=lbw, ubx=ubw, p=[bis_target, tol_target])
+            w_opt = sol['x'].full().flatten()
         self.c_blood_propo_eq = w_opt[0]
         self.c_blood_remi_eq = w_opt[1]
 
         # get Norepinephrine rate from MAP target
-        # first compute the effect of propofol and remifentanil on MAP
-        map_without_nore, co_without_nore = self.hemo_pd.compute_hemo([self.c_blood_propo_eq, self.c_blood_propo_eq],
-                                                                      self.c_blood_remi_eq, 0)
+        # first compute the effect of propofol and remifentanil on MAP,
+        # the nore contribution is additive and is added afterwards
+        map_without_nore, co_without_nore = self.hemo_pd.compute_hemo_base(
+            [self.c_blood_propo_eq, self.c_blood_propo_eq], self.c_blood_remi_eq)
         # Then compute the right nore concentration to meet the MAP target
         wanted_map_effect = map_target - map_without_nore
         self.c_blood_nore_eq = self.hemo_pd.c50_nore_map * (wanted_map_effect /
                                                             (self.hemo_pd.emax_nore_map-wanted_map_effect)
                                                             )**(1/self.hemo_pd.gamma_nore_map)
-        _, self.co_eq = self.hemo_pd.compute_hemo([self.c_blood_propo_eq, self.c_blood_propo_eq],
-                                                  self.c_blood_remi_eq, self.c_blood_nore_eq)
+        _, co_nore = self.hemo_pd.compute_hemo_nore(self.c_blood_nore_eq)
+        self.co_eq = co_without_nore + co_nore
         # update pharmacokinetics model from co value
         if self.co_update:
-            self.propo_pk.update_param_CO(self.co_eq/self.co_base)
-            self.remi_pk.update_param_CO(self.co_eq/self.co_base)
-            self.nore_pk.update_param_CO(self.co_eq/self.co_base)
+            co_ratio = self.co_eq/self.co_base
+            self.propo_pk.update_param_CO(co_ratio)
+            self.remi_pk.update_param_CO(co_ratio)
+            self.nore_pk.update_param_CO(co_ratio)
+            self._last_co_ratio = co_ratio
         # get rate input
-        self.u_propo_eq = self.c_blood_propo_eq / control.dcgain(self.propo_pk.continuous_sys)
-        self.u_remi_eq = self.c_blood_remi_eq / control.dcgain(self.remi_pk.continuous_sys)
-        self.u_nore_eq = self.c_blood_nore_eq / control.dcgain(self.nore_pk.continuous_sys)
+        self.u_propo_eq = self.c_blood_propo_eq / self.propo_pk.dcgain
+        self.u_remi_eq = self.c_blood_remi_eq / self.remi_pk.dcgain
+        self.u_nore_eq = self.c_blood_nore_eq / self.nore_pk.dcgain
 
         return self.u_propo_eq, self.u_remi_eq, self.u_nore_eq
 
@@ -367,10 +570,11 @@ class Patient:
         lbg = []
         ubg = []
 
-        Ap = self.propo_pk.discretize_sys.A
-        Bp = self.propo_pk.discretize_sys.B
-        Ar = self.remi_pk.discretize_sys.A
-        Br = self.remi_pk.discretize_sys.B
+        # cached discrete matrices, no StateSpace wrapper needed
+        Ap = self.propo_pk.Ad
+        Bp = self.propo_pk.Bd.reshape(-1, 1)
+        Ar = self.remi_pk.Ad
+        Br = self.remi_pk.Bd.reshape(-1, 1)
 
         x0p = np.linalg.solve(Ap-np.eye(6), - Bp * 7 / 20)
         x0r = np.linalg.solve(Ar-np.eye(5), - Br * 7 / 10)
@@ -426,19 +630,15 @@ class Patient:
         self.u_remi_eq = u_remi
         self.u_nore_eq = u_nore
 
-        self.c_blood_propo_eq = u_propo * control.dcgain(self.propo_pk.continuous_sys)
-        self.c_blood_remi_eq = u_remi * control.dcgain(self.remi_pk.continuous_sys)
-        self.c_blood_remi_eq = u_nore * control.dcgain(self.nore_pk.continuous_sys)
-
-        # PK models
-        x_init_propo = np.linalg.solve(-self.propo_pk.continuous_sys.A, self.propo_pk.continuous_sys.B * u_propo)
-        self.propo_pk.x = x_init_propo
+        self.c_blood_propo_eq = u_propo * self.propo_pk.dcgain
+        self.c_blood_remi_eq = u_remi * self.remi_pk.dcgain
+        self.c_blood_nore_eq = u_nore * self.nore_pk.dcgain
 
-        x_init_remi = np.linalg.solve(-self.remi_pk.continuous_sys.A, self.remi_pk.continuous_sys.B * u_remi)
-        self.remi_pk.x = x_init_remi
-
-        x_init_nore = np.linalg.solve(-self.nore_pk.continuous_sys.A, self.nore_pk.continuous_sys.B * u_nore)
-        self.nore_pk.x = x_init_nore
+        # PK models: the equilibrium state is the cached unit steady state
+        # scaled by the input
+        self.propo_pk.x = self.propo_pk.x_eq_unit * u_propo
+        self.remi_pk.x = self.remi_pk.x_eq_unit * u_remi
+        self.nore_pk.x = self.nore_pk.x_eq_unit * u_nore
         if self.save_data_bool:
             self.init_dataframe()
             # recompute output variable
@@ -501,37 +701,248 @@ class Patient:
         # compute the blood volume
         self.blood_volume += fluid_rate*self.ts
 
-        # Update the models
-        self.propo_pk.update_param_blood_loss(self.blood_volume/self.blood_volume_init)
-        self.remi_pk.update_param_blood_loss(self.blood_volume/self.blood_volume_init)
-        self.nore_pk.update_param_blood_loss(self.blood_volume/self.blood_volume_init)
-        self.bis_pd.update_param_blood_loss(self.blood_volume/self.blood_volume_init)
+        # Update the models, only if the volume ratio actually changed
+        v_ratio = self.blood_volume/self.blood_volume_init
+        if v_ratio != self._last_v_ratio:
+            self.propo_pk.update_param_blood_loss(v_ratio)
+            self.remi_pk.update_param_blood_loss(v_ratio)
+            self.nore_pk.update_param_blood_loss(v_ratio)
+            self.bis_pd.update_param_blood_loss(v_ratio)
+            self._last_v_ratio = v_ratio
+            # the models were rebuilt without the CO scaling, force the next
+            # CO update through the deadband so it is re-applied this step
+            self._last_co_ratio = float('inf')
 
     def init_dataframe(self):
-        r"""Initilize the dataframe variable."""
-        self.Time = 0
-        column_names = ['Time',  # time
-                        'BIS', 'TOL', 'MAP', 'CO',  # outputs
-                        'u_propo', 'u_remi', 'u_nore',  # inputs
-                        'x_propo_1', 'x_propo_2', 'x_propo_3', 'x_propo_4', 'x_propo_5', 'x_propo_6',  # x_PK_propo
-                        'x_remi_1', 'x_remi_2', 'x_remi_3', 'x_remi_4', 'x_remi_5',  # x_PK_remi
-                        'c_blood_nore', 'blood_volume']  # nore concentration and blood volume
+        r"""Initilize the data storage.
 
-        self.dataframe = pd.DataFrame(columns=column_names)
+        The samples are accumulated in a preallocated float64 numpy buffer
+        grown geometrically; the dataframe itself is only materialized when
+        the dataframe attribute is read, so every column is a typed float
+        column rather than object dtype.
+        """
+        self.Time = 0
+        self._data_buffer = np.zeros((256, len(_COLUMN_NAMES)), dtype=np.float64)
+        self._n_saved = 0
+        self._dataframe_cache = None
+
+    @property
+    def dataframe(self) -> pd.DataFrame:
+        r"""Dataframe containing all the intern variables at each sampling time."""
+        if self._dataframe_cache is None:
+            self._dataframe_cache = pd.DataFrame(
+                self._data_buffer[:self._n_saved].copy(), columns=_COLUMN_NAMES)
+        return self._dataframe_cache
 
     def save_data(self, inputs: list = [0, 0, 0]):
         r"""Save all current intern variable as a new line in self.dataframe."""
-        # store data
+        n = self._n_saved
+        buffer = self._data_buffer
+        if n == buffer.shape[0]:
+            # buffer full: double its capacity
+            buffer = np.zeros((2 * n, buffer.shape[1]), dtype=buffer.dtype)
+            buffer[:n] = self._data_buffer
+            self._data_buffer = buffer
+        buffer[n, 0] = self.Time
+        buffer[n, 1] = np.ravel(self.bis)[0]
+        buffer[n, 2] = np.ravel(self.tol)[0]
+        buffer[n, 3] = np.ravel(self.map)[0]
+        buffer[n, 4] = np.ravel(self.co)[0]
+        buffer[n, _SLICE_INPUTS] = inputs
+        buffer[n, _SLICE_X_PROPO] = np.ravel(self.propo_pk.x)
+        buffer[n, _SLICE_X_REMI] = np.ravel(self.remi_pk.x)
+        buffer[n, _IDX_C_NORE] = np.ravel(self.nore_pk.x)[0]
+        buffer[n, _IDX_BLOOD_VOLUME] = self.blood_volume
+        self._n_saved = n + 1
+        self._dataframe_cache = None
+
+
+class PatientCohort:
+    r"""Vectorized simulation of a whole cohort of patients in structure-of-arrays form.
+
+    The discrete PK dynamics of every patient are stacked with
+    CompartmentModel.batch and advanced with one batched matrix product per
+    drug and per step; the PD outputs are evaluated on whole arrays through
+    the generic compute_* methods.  This is much faster than stepping a list
+    of Patient instances when only the drug concentrations and the nominal
+    outputs are needed.
+
+    Limitations compared to Patient: the PD models are the shared nominal
+    ones (no per-patient PD uncertainty), and the blood loss, cardiac output
+    update and measurement noise mechanisms are not available.
+
+    Parameters
+    ----------
+    patient_characteristics : list
+        List of [age (yr), height(cm), weight(kg), gender(0: female, 1: male)], one per patient.
+    co_base : float, optional
+        Initial cardiac output. The default is 6.5L/min.
+    map_base : float, optional
+        Initial Mean Arterial Pressure. The default is 90mmHg.
+    model_propo : str, optional
+        Name of the Propofol PK Model. The default is 'Schnider'.
+    model_remi : str, optional
+        Name of the Remifentanil PK Model. The default is 'Minto'.
+    ts : float, optional
+        Sampling time (s). The default is 1.
+    dtype : numpy dtype, optional
+        Floating type of the stacked matrices and states.  np.float32 halves
+        the memory traffic of large cohorts at the price of ~1e-6 relative
+        accuracy on the outputs. The default is np.float64.
+
+    Attributes
+    ----------
+    n_patient : int
+        Number of patients in the cohort.
+    x_propo, x_remi, x_nore : numpy array
+        Stacked PK states, one row per patient.
+    bis, tol, map, co : numpy array
+        Last computed outputs, one value per patient.
+
+    """
 
-        new_line = {'Time': self.Time,
-                    'BIS': self.bis, 'TOL': self.tol, 'MAP': self.map, 'CO': self.co,  # outputs
-                    'u_propo': inputs[0], 'u_remi': inputs[1], 'u_nore': inputs[2],  # inputs
-                    'c_blood_nore': self.nore_pk.x[0],  # concentration
-                    'blood_volume': self.blood_volume}  # blood volume
+    def __init__(self, patient_characteristics: list,
+                 co_base: float = 6.5, map_base: float = 90,
+                 model_propo: str = 'Schnider', model_remi: str = 'Minto',
+                 ts: float = 1, dtype=np.float64):
+        """Init the class."""
+        self.n_patient = len(patient_characteristics)
+        self.ts = ts
+        lbm = []
+        for age, height, weight, gender in patient_characteristics:
+            if gender == 1:  # homme
+                lbm.append(1.1 * weight - 128 * (weight / height) ** 2)
+            else:  # femme
+                lbm.append(1.07 * weight - 148 * (weight / height) ** 2)
+
+        # stacked discrete PK dynamics, one batched discretization per drug
+        self._Ad_propo, self._Bd_propo, _ = CompartmentModel.batch(
+            patient_characteristics, lbm, 'Propofol', model=model_propo, ts=ts)
+        self._Ad_remi, self._Bd_remi, _ = CompartmentModel.batch(
+            patient_characteristics, lbm, 'Remifentanil', model=model_remi, ts=ts)
+        self._Ad_nore, self._Bd_nore, _ = CompartmentModel.batch(
+            patient_characteristics, lbm, 'Norepinephrine', ts=ts)
+        if dtype is not np.float64:
+            self._Ad_propo = self._Ad_propo.astype(dtype)
+            self._Bd_propo = self._Bd_propo.astype(dtype)
+            self._Ad_remi = self._Ad_remi.astype(dtype)
+            self._Bd_remi = self._Bd_remi.astype(dtype)
+            self._Ad_nore = self._Ad_nore.astype(dtype)
+            self._Bd_nore = self._Bd_nore.astype(dtype)
+        self._dtype = dtype
+        self.x_propo = np.zeros((self.n_patient, 6), dtype=dtype)
+        self.x_remi = np.zeros((self.n_patient, 5), dtype=dtype)
+        self.x_nore = np.zeros((self.n_patient, 1), dtype=dtype)
+
+        # shared nominal PD models
+        self.bis_pd = BIS_model(hill_model='Bouillon')
+        self.tol_pd = TOL_model(model='Bouillon')
+        self.hemo_pd = Hemo_PD_model(co_base=co_base, map_base=map_base)
+
+    def one_step(self, u_propo=0, u_remi=0, u_nore=0) -> tuple:
+        r"""Advance the whole cohort by one sampling time.
 
-        line_x_propo = {'x_propo_' + str(i+1): self.propo_pk.x[i] for i in range(6)}
-        line_x_remi = {'x_remi_' + str(i+1): self.remi_pk.x[i] for i in range(5)}
-        new_line.update(line_x_propo)
-        new_line.update(line_x_remi)
+        Parameters
+        ----------
+        u_propo, u_remi, u_nore : float or numpy array, optional
+            Infusion rates, either one value shared by all the patients or one
+            value per patient. The defaults are 0.
 
-        self.dataframe = pd.concat((self.dataframe, pd.DataFrame(new_line)), ignore_index=True)
+        Returns
+        -------
+        bis, co, map, tol : numpy array
+            Outputs of every patient.
+
+        """
+        u_propo = np.broadcast_to(np.asarray(u_propo, dtype=self._dtype), (self.n_patient,))
+        u_remi = np.broadcast_to(np.asarray(u_remi, dtype=self._dtype), (self.n_patient,))
+        u_nore = np.broadcast_to(np.asarray(u_nore, dtype=self._dtype), (self.n_patient,))
+        self.x_propo = CompartmentModel.vectorized_step(
+            self._Ad_propo, self._Bd_propo, self.x_propo, u_propo)
+        self.x_remi = CompartmentModel.vectorized_step(
+            self._Ad_remi, self._Bd_remi, self.x_remi, u_remi)
+        self.x_nore = CompartmentModel.vectorized_step(
+            self._Ad_nore, self._Bd_nore, self.x_nore, u_nore)
+
+        cep = self.x_propo[:, 3]
+        cer = self.x_remi[:, 3]
+        cn = self.x_nore[:, 0]
+        self.bis = self.bis_pd.compute_bis(cep, cer)
+        self.tol = self.tol_pd.compute_tol(cep, cer)
+        self.map, self.co = self.hemo_pd.compute_hemo(
+            [self.x_propo[:, 4], self.x_propo[:, 5]], self.x_remi[:, 4], cn)
+        return self.bis, self.co, self.map, self.tol
+
+
+def _run_patient_case(case: tuple) -> pd.DataFrame:
+    """Simulate one patient of simulate_population (module level so it can be pickled)."""
+    patient_characteristic, patient_kwargs, u_propo, u_remi, u_nore, noise = case
+    patient = Patient(patient_characteristic, **patient_kwargs)
+    for k in range(len(u_propo)):
+        patient.one_step(u_propo=u_propo[k], u_remi=u_remi[k], u_nore=u_nore[k], noise=noise)
+    return patient.dataframe
+
+
+def simulate_population(patient_characteristics: list, u_propo: list, u_remi: list,
+                        u_nore: list = None, noise: bool = True,
+                        n_workers: int = None, seeds: list = None,
+                        **patient_kwargs) -> list:
+    r"""Simulate a population of patients in parallel, one process per patient.
+
+    The parallelism is coarse grained: each worker builds its own Patient and
+    runs the whole input profile, so the inter-process communication is limited
+    to the patient description and the resulting dataframe.
+
+    Parameters
+    ----------
+    patient_characteristics : list
+        List of [age (yr), height(cm), weight(kg), gender(0: female, 1: male)], one per patient.
+    u_propo : list
+        Propofol infusion rate profile (mg/s), either one sequence shared by all
+        the patients or one sequence per patient.
+    u_remi : list
+        Remifentanil infusion rate profile (µg/s), same convention.
+    u_nore : list, optional
+        Norepinephrine infusion rate profile (µg/s), same convention. The default is no norepinephrine.
+    noise : bool, optional
+        Add measurement noise on the outputs. The default is True.
+    n_workers : int, optional
+        Number of processes. The default is the number of CPUs.
+    seeds : list, optional
+        One seed per patient, to make the population reproducible. The default is None.
+    **patient_kwargs
+        Extra keyword arguments forwarded to the Patient constructor
+        (e.g. ts, model_propo, random_PK).
+
+    Returns
+    -------
+    list of pd.DataFrame
+        The dataframe of each patient, in the same order as patient_characteristics.
+
+    """
+    n_patient = len(patient_characteristics)
+    u_propo = np.asarray(u_propo)
+    u_remi = np.asarray(u_remi)
+    if u_nore is None:
+        u_nore = np.zeros_like(u_propo)
+    else:
+        u_nore = np.asarray(u_nore)
+    # broadcast a shared profile to every patient
+    if u_propo.ndim == 1:
+        u_propo = np.tile(u_propo, (n_patient, 1))
+    if u_remi.ndim == 1:
+        u_remi = np.tile(u_remi, (n_patient, 1))
+    if u_nore.ndim == 1:
+        u_nore = np.tile(u_nore, (n_patient, 1))
+
+    cases = []
+    for i in range(n_patient):
+        kwargs = dict(patient_kwargs)
+        if seeds is not None:
+            kwargs['seed'] = seeds[i]
+        cases.append((patient_characteristics[i], kwargs, u_propo[i], u_remi[i], u_nore[i], noise))
+
+    if n_workers == 1:
+        return [_run_patient_case(case) for case in cases]
+    with multiprocessing.Pool(n_workers) as pool:
+        return pool.map(_run_patient_case, cases)
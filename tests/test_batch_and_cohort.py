@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Test file for the batch simulation entry points: Patient.simulate,
+the seed argument, PatientCohort and simulate_population."""
+
+import numpy as np
+from python_anesthesia_simulator import Patient, PatientCohort, simulate_population
+
+ts = 5
+N_simu = 50
+rng = np.random.default_rng(0)
+u_propo = rng.random(N_simu) * 0.2
+u_remi = rng.random(N_simu) * 0.1
+u_nore = rng.random(N_simu) * 0.02
+
+patient_characteristics = [[25, 165, 60, 0], [45, 170, 70, 1], [70, 180, 90, 1]]
+
+# %% Patient.simulate gives the same trajectory as an explicit one_step loop
+George_1 = Patient([45, 170, 70, 1], ts=ts, co_update=True, seed=0)
+df_batch = George_1.simulate(u_propo, u_remi, u_nore, noise=True)
+
+George_2 = Patient([45, 170, 70, 1], ts=ts, co_update=True, seed=0)
+for index in range(N_simu):
+    George_2.one_step(u_propo[index], u_remi[index], u_nore[index], noise=True)
+
+assert np.array_equal(df_batch.values, George_2.dataframe.values)
+
+# %% the same seed reproduces the trajectory, another seed changes the noise
+George_3 = Patient([45, 170, 70, 1], ts=ts, co_update=True, seed=0)
+assert np.array_equal(df_batch.values, George_3.simulate(u_propo, u_remi, u_nore, noise=True).values)
+
+George_4 = Patient([45, 170, 70, 1], ts=ts, co_update=True, seed=1)
+assert not np.array_equal(df_batch.values, George_4.simulate(u_propo, u_remi, u_nore, noise=True).values)
+
+# %% PatientCohort matches a list of Patient instances stepped one by one
+cohort = PatientCohort(patient_characteristics, ts=ts)
+patient_list = [Patient(charac, ts=ts) for charac in patient_characteristics]
+
+for index in range(N_simu):
+    bis_cohort, co_cohort, map_cohort, tol_cohort = cohort.one_step(
+        u_propo[index], u_remi[index], u_nore[index])
+    for i, patient in enumerate(patient_list):
+        bis, co, map_, tol = patient.one_step(
+            u_propo[index], u_remi[index], u_nore[index], noise=False)
+        assert abs(bis_cohort[i] - bis) < 1e-8
+        assert abs(co_cohort[i] - co) < 1e-8
+        assert abs(map_cohort[i] - map_) < 1e-8
+        assert abs(tol_cohort[i] - tol) < 1e-8
+
+# %% simulate_population gives the same result serial and parallel
+seeds = [0, 1, 2]
+df_list_serial = simulate_population(patient_characteristics, u_propo, u_remi, u_nore,
+                                     noise=True, n_workers=1, seeds=seeds, ts=ts)
+df_list_parallel = simulate_population(patient_characteristics, u_propo, u_remi, u_nore,
+                                       noise=True, n_workers=2, seeds=seeds, ts=ts)
+for df_serial, df_parallel in zip(df_list_serial, df_list_parallel):
+    assert np.array_equal(df_serial.values, df_parallel.values)
+
+print('test ok')